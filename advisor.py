@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+"""advisor.py
+
+Provides a class for deciding when to make an accusation, by weighing the
+chance that the most likely solution is correct against the chance that an
+opponent solves the game first.
+"""
+
+__author__ = 'Curtis Belmonte'
+
+import itertools
+import math
+from typing import Dict, List, Set, Tuple
+
+from ledger import Ledger
+from pieces import Card, ROOMS, SUSPECTS, WEAPONS
+from probability import ProbabilityTable
+from trackers import SuggestionTracker
+
+# Number of most likely cards per category to consider for the solution
+CANDIDATES_PER_CATEGORY = 2
+
+# Largest probability table, in forward states per card, for which the exact
+# chance of each candidate solution is computed, to bound the time per turn
+MAX_JOINT_STATES = 2000
+
+
+class AccusationAdvisor(object):
+    """Recommends whether the user should make an accusation now or wait.
+
+    Accusing now wins if the most likely solution is correct. Waiting can only
+    win if no opponent solves the game first, so the advisor recommends
+    accusing once the most likely solution is at least as likely to be correct
+    as every opponent is to fail to solve the game within the horizon.
+
+    If the probability table is too large for the exact chance of a solution to
+    be computed quickly, it is estimated as the product of the chances of each
+    of its cards being in the solution.
+    """
+
+    def __init__(
+        self,
+        opponents: List[str],
+        ledger: Ledger,
+        probabilities: ProbabilityTable,
+        suggestions: SuggestionTracker,
+        horizon: int = 1
+    ) -> None:
+        self._opponents = opponents
+        self._ledger = ledger
+        self._probabilities = probabilities
+        self._suggestions = suggestions
+        self._horizon = horizon
+
+        self._solution: Tuple[Card, Card, Card] = (
+            SUSPECTS[0],
+            WEAPONS[0],
+            ROOMS[0],
+        )
+        self._solution_probability = 0.0
+        self._is_exact = True
+        self._race_probabilities: Dict[str, float] = {}
+
+        self.update()
+
+    def __repr__(self) -> str:
+        lines = ['Accusation Advice:']
+        lines.append('  Best guess: {} ({:.1f}%{})'.format(
+            ', '.join(card.name for card in self._solution),
+            100 * self._solution_probability,
+            '' if self._is_exact else ', estimated'
+        ))
+        lines.append('  Chance of solving within {} turn(s):'.format(
+            self._horizon
+        ))
+        for opponent in self._opponents:
+            lines.append('    {}: {:.1f}%'.format(
+                opponent,
+                100 * self._race_probabilities[opponent]
+            ))
+        lines.append('  Recommendation: {}'.format(
+            'accuse now' if self.should_accuse() else 'wait'
+        ))
+        return '\n'.join(lines)
+
+    def get_race_probability(self, opponent: str) -> float:
+        """Returns the chance that an opponent solves within the horizon."""
+        return self._race_probabilities[opponent]
+
+    def get_solution(self) -> Tuple[Tuple[Card, Card, Card], float]:
+        """Returns the most likely solution and the chance that it's correct."""
+        return self._solution, self._solution_probability
+
+    def should_accuse(self) -> bool:
+        """Checks if the user should make an accusation now."""
+        no_race_probability = 1.0
+        for probability in self._race_probabilities.values():
+            no_race_probability *= 1 - probability
+        return self._solution_probability >= no_race_probability
+
+    def update(self) -> None:
+        """Updates the advice based on the current ledger and suggestions."""
+        self._probabilities.update()
+
+        # Find the most likely solution among the likeliest cards per category
+        candidates = [
+            sorted(
+                category,
+                key=self._probabilities.get_solution_probability,
+                reverse=True
+            )[:CANDIDATES_PER_CATEGORY]
+            for category in (SUSPECTS, WEAPONS, ROOMS)
+        ]
+        self._is_exact = (
+            self._probabilities.get_state_count() <= MAX_JOINT_STATES
+        )
+        self._solution_probability = -1.0
+        for suspect, weapon, room in itertools.product(*candidates):
+            if self._is_exact:
+                probability = (
+                    self._probabilities.get_joint_solution_probability(
+                        (suspect, weapon, room)
+                    )
+                )
+            else:
+                probability = 1.0
+                for card in (suspect, weapon, room):
+                    probability *= (
+                        self._probabilities.get_solution_probability(card)
+                    )
+            if probability > self._solution_probability:
+                self._solution = (suspect, weapon, room)
+                self._solution_probability = probability
+
+        for opponent in self._opponents:
+            self._race_probabilities[opponent] = self._estimate_race(opponent)
+
+    @staticmethod
+    def _count_distinct_cards(card_options: List[List[Card]]) -> int:
+        """Returns the most different cards that can be chosen from the lists.
+
+        One card is chosen from each list, by finding a maximum matching of
+        lists to cards with augmenting paths.
+        """
+        matches: Dict[Card, int] = {}
+
+        def match(i: int, visited: Set[Card]) -> bool:
+            """Tries to match list i to a card, rematching others if needed."""
+            for card in card_options[i]:
+                if card not in visited:
+                    visited.add(card)
+                    if card not in matches or match(matches[card], visited):
+                        matches[card] = i
+                        return True
+            return False
+
+        return sum(1 for i in range(len(card_options)) if match(i, set()))
+
+    def _estimate_race(self, opponent: str) -> float:
+        """Estimates the chance that an opponent solves within the horizon.
+
+        Each suggestion that the opponent makes and someone disproves shows them
+        one of the suggested cards that the showing player might hold, and they
+        solve the game once they have seen every card outside of their hand and
+        the solution. They are assumed to have seen as many different cards as
+        their disproved suggestions could have shown them, and the chance that
+        their next suggestion shows them a new card is estimated from how many
+        of their past suggestions did. If we know they hold none of the cards
+        in a suggestion that no one could disprove, they must already know the
+        solution.
+        """
+        players = self._ledger.get_players()
+        opponent_index = players.index(opponent)
+        history = self._suggestions.get_suggestions(opponent)
+
+        # Check for an undisproved suggestion with no cards from their hand
+        for cards, _, showing_player in history:
+            if showing_player is None and all(
+                self._ledger.get_row(card)[opponent_index] == Ledger.NO
+                for card in cards
+            ):
+                return 1.0
+
+        # Find the cards that each disproved suggestion could have shown them
+        shown_options = [
+            [
+                card for card in cards
+                if self._ledger.get_row(card)[players.index(showing_player)]
+                != Ledger.NO
+            ]
+            for cards, _, showing_player in history
+            if showing_player is not None
+        ]
+        seen_count = self._count_distinct_cards(shown_options)
+
+        # Find how many more cards they need to see, assuming the largest hand
+        hand_size = max(
+            sizes[opponent_index]
+            for sizes in self._ledger.get_hand_size_hypotheses()
+        )
+        needed_count = len(Card.__members__) - 3 - hand_size - seen_count
+        if needed_count <= 0:
+            return 1.0
+        if needed_count > self._horizon:
+            return 0.0
+
+        # Find the chance that enough of their next suggestions show new cards
+        shown_probability = (seen_count + 1) / (len(history) + 2)
+        return sum(
+            math.comb(self._horizon, k)
+            * shown_probability ** k
+            * (1 - shown_probability) ** (self._horizon - k)
+            for k in range(needed_count, self._horizon + 1)
+        )
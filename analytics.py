@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+"""analytics.py
+
+Computes aggregate statistics over a collection of recorded games, including
+how many turns each game took to solve, which rules made deductions, how often
+each card was suggested, and how much was learned from each opening suggestion.
+
+Each game is recorded in its own file, in the input format for the streaming
+mode of clue.py. Games are analyzed one at a time by a pool of worker
+processes, and the statistics for each game are merged into a running total,
+so memory use doesn't grow with the number of games. The totals are written to
+a columnar file: Parquet if the output path ends in .parquet (which requires
+pyarrow), or otherwise JSON with a list of values for each column.
+"""
+
+__author__ = 'Curtis Belmonte'
+
+import argparse
+import json
+import multiprocessing
+import os
+from collections import Counter
+from typing import (
+    Any,
+    Counter as CounterType,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+import clue
+from trackers import ShownCardTracker, SkippedCardTracker, SuggestionTracker
+
+# Names and order of the columns in the output file
+COLUMNS = ('statistic', 'player_count', 'seat', 'key', 'count', 'total')
+
+
+class GameStats(object):
+    """Aggregate statistics for any number of games, which can be merged."""
+
+    def __init__(self) -> None:
+        self._game_count = 0
+        self._invalid_line_count = 0
+
+        # Number of games solved on each turn (or None if unsolved), indexed by
+        # player count and the user's seat relative to the first player
+        self._solve_turns: Dict[Tuple[int, int], CounterType[Optional[int]]]
+        self._solve_turns = {}
+
+        # Number of entries deduced by each rule
+        self._rule_deductions: CounterType[str] = Counter()
+
+        # Number of times each card was suggested
+        self._card_suggestions: CounterType[str] = Counter()
+
+        # Number of games opened with each suggestion, and the total number of
+        # entries known to the user after it
+        self._opening_counts: CounterType[Tuple[str, ...]] = Counter()
+        self._opening_known: CounterType[Tuple[str, ...]] = Counter()
+
+    def add_game(self, lines: Iterable[str]) -> None:
+        """Updates statistics with a single game, given its recorded lines."""
+        settings: Dict[str, List[str]] = {}
+        turn_count = 0
+        solve_turn: Optional[int] = None
+        seat: Optional[int] = None
+        for line in lines:
+            tokens = clue.split_stream_line(line)
+            if not tokens:
+                continue
+
+            # noinspection PyBroadException
+            try:
+                keyword = tokens[0].lower()
+                if turn_count == 0 and keyword in clue.SETUP_KEYWORDS:
+                    settings[keyword] = tokens[1:]
+                    continue
+
+                # Set up the ledger and trackers at the first suggestion
+                if turn_count == 0:
+                    ledger = clue.create_stream_ledger(settings)
+                    player = settings['player'][0]
+                    all_players = ledger.get_players()
+                    initial_known_count = len(clue.find_known_entries(ledger))
+                    suggestions = SuggestionTracker()
+                    shown_cards = ShownCardTracker(all_players[1:])
+                    skipped_cards = SkippedCardTracker()
+
+                suggestion = clue.parse_suggestion(tokens, player, all_players)
+                clue.record_suggestions(
+                    player,
+                    all_players,
+                    ledger,
+                    shown_cards,
+                    skipped_cards,
+                    suggestions,
+                    [suggestion]
+                )
+            except Exception:
+                self._invalid_line_count += 1
+                continue
+
+            turn_count += 1
+            cards = suggestion[1]
+            self._card_suggestions.update(card.name for card in cards)
+
+            # Count how many entries were learned from the opening suggestion
+            if turn_count == 1:
+                opening = tuple(card.name for card in sorted(cards))
+                known_count = len(clue.find_known_entries(ledger))
+                self._opening_counts[opening] += 1
+                self._opening_known[opening] += (
+                    known_count - initial_known_count
+                )
+                seat = -all_players.index(suggestion[0]) % len(all_players)
+
+            if solve_turn is None and ledger.solve() is not None:
+                solve_turn = turn_count
+
+        # Ignore games without any valid suggestions
+        if seat is None:
+            return
+
+        self._game_count += 1
+        key = (len(all_players), seat)
+        self._solve_turns.setdefault(key, Counter())[solve_turn] += 1
+        self._rule_deductions.update(ledger.get_deduction_counts())
+
+    def get_columns(self) -> Dict[str, List[Any]]:
+        """Returns all statistics as a table, with a list of values per column.
+
+        Each row contains the name of a statistic, the player count and seat it
+        applies to (if any), a key (such as a rule or card name), a count, and
+        a total (for statistics that are averaged over the count).
+        """
+        rows: List[Tuple[Any, ...]] = [
+            ('games', None, None, None, self._game_count, None),
+            (
+                'invalid_lines',
+                None,
+                None,
+                None,
+                self._invalid_line_count,
+                None,
+            ),
+        ]
+        for (player_count, seat), turns in sorted(self._solve_turns.items()):
+            for turn, count in sorted(
+                turns.items(),
+                key=lambda item: (item[0] is None, item[0])
+            ):
+                rows.append((
+                    'solve_turns',
+                    player_count,
+                    seat,
+                    'unsolved' if turn is None else str(turn),
+                    count,
+                    None,
+                ))
+        for rule, count in sorted(self._rule_deductions.items()):
+            rows.append(('rule_deductions', None, None, rule, count, None))
+        for card, count in sorted(self._card_suggestions.items()):
+            rows.append(('card_suggestions', None, None, card, count, None))
+        for opening, count in sorted(self._opening_counts.items()):
+            rows.append((
+                'opening_known_entries',
+                None,
+                None,
+                ' '.join(opening),
+                count,
+                self._opening_known[opening],
+            ))
+        return {
+            name: [row[i] for row in rows] for i, name in enumerate(COLUMNS)
+        }
+
+    def merge(self, other: 'GameStats') -> None:
+        """Adds the statistics from another set of games to these ones."""
+        self._game_count += other._game_count
+        self._invalid_line_count += other._invalid_line_count
+        for key, turns in other._solve_turns.items():
+            self._solve_turns.setdefault(key, Counter()).update(turns)
+        self._rule_deductions.update(other._rule_deductions)
+        self._card_suggestions.update(other._card_suggestions)
+        self._opening_counts.update(other._opening_counts)
+        self._opening_known.update(other._opening_known)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Analyze recorded Clue games')
+    parser.add_argument('output', help='path of the columnar file to write')
+    parser.add_argument(
+        'logs',
+        nargs='+',
+        help='recorded game files, or directories containing them'
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='number of worker processes'
+    )
+    args = parser.parse_args()
+
+    stats = analyze_files(find_log_files(args.logs), args.jobs)
+    write_columns(stats.get_columns(), args.output)
+
+
+def analyze_file(path: str) -> GameStats:
+    """Returns statistics for the game recorded in a single file."""
+    stats = GameStats()
+    with open(path) as lines:
+        stats.add_game(lines)
+    return stats
+
+
+def analyze_files(paths: Iterable[str], job_count: int) -> GameStats:
+    """Returns statistics for all games, analyzed by worker processes."""
+    stats = GameStats()
+    with multiprocessing.Pool(job_count) as pool:
+        for game_stats in pool.imap_unordered(analyze_file, paths, 16):
+            stats.merge(game_stats)
+    return stats
+
+
+def find_log_files(paths: Iterable[str]) -> Iterator[str]:
+    """Yields each given file path, and all files under each directory path."""
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, _, file_names in os.walk(path):
+                for file_name in sorted(file_names):
+                    yield os.path.join(dir_path, file_name)
+        else:
+            yield path
+
+
+def write_columns(columns: Dict[str, List[Any]], path: str) -> None:
+    """Writes a table to a Parquet or JSON file, depending on the extension."""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('Writing Parquet files requires pyarrow')
+        pyarrow.parquet.write_table(pyarrow.table(columns), path)
+    else:
+        with open(path, 'w') as output:
+            json.dump(columns, output)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,21 +4,76 @@
 
 A note-taking client for the board game Clue. Updates in real time the possible
 cards held by all players as suggestions/accusations are made and disproved.
+
+Run with --stream to read the game from a file (or stdin) instead of prompting
+for it, with one line per setup item or suggestion:
+
+    player Alice                    # your name
+    opponents Bob Carol Dave        # other players, in turn order
+    cards mustard rope hall ...     # your cards
+    sizes 5 ? 4                     # opponents' hand sizes ('?' if unknown)
+    bob green candle library carol  # suggester, cards, player showing
+    carol plum dagger kitchen alice plum  # ... and shown card, if known to you
+
+Names and cards may be abbreviated to a prefix, as when prompted, and anything
+after a '#' is ignored. Each ledger entry that becomes known is written to
+stdout as a line "cell PLAYER CARD YES|NO", followed by "solution SUSPECT
+WEAPON ROOM" once the solution is known. With --final-only, only the final
+solution (or "unsolved") is written once the input ends.
 """
 
 __author__ = 'Curtis Belmonte'
 
+import argparse
 import sys
 import traceback
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 import prefix
-from ledger import Ledger
+from advisor import AccusationAdvisor
+from ledger import Ledger, LedgerFactory
 from pieces import Card
+from probability import ProbabilityTable
 from trackers import ShownCardTracker, SkippedCardTracker, SuggestionTracker
 
+# Type alias for the info entered about a single suggestion
+Suggestion = Tuple[str, List[Card], Optional[str], Optional[Card]]
+
+# Keywords for the lines that set up a game in streaming mode
+SETUP_KEYWORDS = ('player', 'opponents', 'cards', 'sizes')
+
+# Shared factory, so ledgers for repeated game setups are cheap to create
+LEDGER_FACTORY = LedgerFactory()
+
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description='Note-taking client for Clue')
+    parser.add_argument(
+        '--stream',
+        nargs='?',
+        const='-',
+        metavar='FILE',
+        help='read the game from FILE (or stdin) instead of prompting for it'
+    )
+    parser.add_argument(
+        '--final-only',
+        action='store_true',
+        help='in streaming mode, only write the final solution'
+    )
+    args = parser.parse_args()
+
+    if args.stream is None:
+        play_interactive()
+    elif args.stream == '-':
+        play_stream(sys.stdin, args.final_only)
+    else:
+        with open(args.stream) as lines:
+            play_stream(lines, args.final_only)
+
+
+def play_interactive() -> None:
+    """Runs the game loop, prompting for info and showing the game state."""
+
     # Prompt user for initial game info, including players and cards
     player = input('Enter your name: ').strip()
     opponents = input('Enter opponents (in order): ').strip().split()
@@ -27,23 +82,32 @@ def main() -> None:
     ]
 
     # Prompt for opponents' hand sizes if necessary
-    hand_sizes = [len(own_cards)]
+    opponent_hand_sizes: List[Optional[int]] = []
     card_count = len(Card.__members__)
     player_count = 1 + len(opponents)
     if (card_count - 3) % player_count != 0:
         for opponent in opponents:
-            hand_sizes.append(
-                int(input('Enter hand size for {}: '.format(opponent)).strip())
+            hand_size = input(
+                'Enter hand size for {} (blank if unknown): '.format(opponent)
+            ).strip()
+            opponent_hand_sizes.append(
+                None if hand_size == '' else int(hand_size)
             )
-    else:
-        hand_sizes *= player_count
 
     # Set up the ledger and card/suggestion trackers
     all_players = [player] + opponents
-    ledger = Ledger(all_players, hand_sizes, player, own_cards)
+    ledger = create_ledger(
+        player,
+        opponents,
+        own_cards,
+        opponent_hand_sizes,
+        record_provenance=True
+    )
     suggestions = SuggestionTracker()
     shown_cards = ShownCardTracker(opponents)
     skipped_cards = SkippedCardTracker()
+    probabilities = ProbabilityTable(ledger)
+    advisor = AccusationAdvisor(opponents, ledger, probabilities, suggestions)
 
     # Main game loop
     did_solve = False
@@ -52,7 +116,16 @@ def main() -> None:
         print()
         print('#' * 79)
         print()
-        for info in (suggestions, shown_cards, skipped_cards, ledger):
+        infos: List[object] = [suggestions, shown_cards, skipped_cards, ledger]
+
+        # Probabilities can't be shown if the ledger has a contradiction
+        try:
+            advisor.update()
+            infos += [probabilities, advisor]
+        except ValueError as e:
+            infos.append('Probabilities unavailable: {}'.format(e))
+
+        for info in infos:
             print(info)
             print()
 
@@ -83,6 +156,158 @@ def main() -> None:
             show_continue_prompt(1)
 
 
+def play_stream(lines: Iterable[str], final_only: bool = False) -> None:
+    """Runs the game based on lines of input, writing updates to stdout.
+
+    Setup lines must come before the first suggestion. Errors in a line are
+    reported to stderr, and the line is skipped.
+    """
+    settings: Dict[str, List[str]] = {}
+    ledger: Optional[Ledger] = None
+    known_entries: Set[Tuple[str, Card, str]] = set()
+    did_solve = False
+    for line_number, line in enumerate(lines, 1):
+        tokens = split_stream_line(line)
+        if not tokens:
+            continue
+
+        # noinspection PyBroadException
+        try:
+            if ledger is None and tokens[0].lower() in SETUP_KEYWORDS:
+                settings[tokens[0].lower()] = tokens[1:]
+                continue
+
+            # Set up the ledger and trackers once the first suggestion is seen
+            if ledger is None:
+                player = settings['player'][0]
+                opponents = settings['opponents']
+                all_players = [player] + opponents
+                ledger = create_stream_ledger(settings)
+                suggestions = SuggestionTracker()
+                shown_cards = ShownCardTracker(opponents)
+                skipped_cards = SkippedCardTracker()
+
+            record_suggestions(
+                player,
+                all_players,
+                ledger,
+                shown_cards,
+                skipped_cards,
+                suggestions,
+                [parse_suggestion(tokens, player, all_players)]
+            )
+        except Exception as e:
+            print('Line {}: {!r}'.format(line_number, e), file=sys.stderr)
+            continue
+
+        # Write any newly known entries and the solution, if found
+        if not final_only:
+            new_entries = find_known_entries(ledger) - known_entries
+            for player_name, card, value in sorted(
+                new_entries,
+                key=lambda entry: (entry[1], all_players.index(entry[0]))
+            ):
+                print('cell {} {} {}'.format(player_name, card.name, value))
+            known_entries |= new_entries
+
+            solution = ledger.solve()
+            if solution is not None and not did_solve:
+                print('solution ' + ' '.join(card.name for card in solution))
+                did_solve = True
+            sys.stdout.flush()
+
+    if final_only:
+        solution = None if ledger is None else ledger.solve()
+        if solution is None:
+            print('unsolved')
+        else:
+            print('solution ' + ' '.join(card.name for card in solution))
+
+
+def create_ledger(
+    player: str,
+    opponents: List[str],
+    own_cards: List[Card],
+    opponent_hand_sizes: List[Optional[int]],
+    record_provenance: bool = False
+) -> Ledger:
+    """Creates a ledger for a new game with the given players and cards.
+
+    Any of opponent_hand_sizes may be None if unknown, or the list may be empty
+    if all are unknown. If record_provenance is True, the ledger can explain
+    why each entry was marked.
+    """
+    hand_sizes: List[Optional[int]] = [len(own_cards)]
+    if opponent_hand_sizes:
+        hand_sizes += opponent_hand_sizes
+    else:
+        hand_sizes += [None] * len(opponents)
+    return LEDGER_FACTORY.create(
+        [player] + opponents,
+        hand_sizes,
+        player,
+        own_cards,
+        record_provenance
+    )
+
+
+def create_stream_ledger(settings: Dict[str, List[str]]) -> Ledger:
+    """Creates a ledger for a new game from setup lines of streaming input.
+
+    settings: Tokens following each setup keyword, indexed by keyword
+    """
+    return create_ledger(
+        settings['player'][0],
+        settings['opponents'],
+        [Card.parse(s) for s in settings.get('cards', [])],
+        [
+            None if size == '?' else int(size)
+            for size in settings.get('sizes', [])
+        ]
+    )
+
+
+def split_stream_line(line: str) -> List[str]:
+    """Splits a line of streaming input into tokens, ignoring any comment."""
+    return line.split('#', 1)[0].split()
+
+
+def find_known_entries(ledger: Ledger) -> Set[Tuple[str, Card, str]]:
+    """Returns (player, card, YES/NO) for each known entry in the ledger."""
+    known_entries: Set[Tuple[str, Card, str]] = set()
+    players = ledger.get_players()
+    for card in Card.__members__.values():
+        for player, entry in zip(players, ledger.get_row(card)):
+            if entry == Ledger.YES:
+                known_entries.add((player, card, 'YES'))
+            elif entry == Ledger.NO:
+                known_entries.add((player, card, 'NO'))
+    return known_entries
+
+
+def parse_suggestion(
+    tokens: List[str],
+    player: str,
+    all_players: List[str]
+) -> Suggestion:
+    """Parses a suggestion from a line of streaming input.
+
+    tokens: Suggesting player, 3 suggested cards, and optionally the player
+        showing a card and then the shown card (if known to the user)
+    player: Name of the user
+    all_players: Turn-ordered list of the names of all players in the game
+    """
+    assert 4 <= len(tokens) <= 6, 'Suggestions involve 3 cards'
+    suggesting_player = prefix.find_match(tokens[0], all_players)
+    suggested_cards = [Card.parse(name) for name in tokens[1:4]]
+    showing_player = (
+        prefix.find_match(tokens[4], all_players) if len(tokens) > 4 else None
+    )
+    shown_card = Card.parse(tokens[5]) if len(tokens) > 5 else None
+    assert shown_card is None or player in (suggesting_player, showing_player)
+    return suggesting_player, suggested_cards, showing_player, shown_card
+
+
 def process_input(
     player: str,
     all_players: List[str],
@@ -91,10 +316,63 @@ def process_input(
     skipped_cards: SkippedCardTracker,
     suggestions: SuggestionTracker
 ) -> None:
-    """Updates the current known game state based on user input."""
+    """Updates the current known game state based on user input.
 
-    # Prompt user to enter relevant info for each suggestion
+    Entering a blank suggesting player starts a batch of suggestions (e.g. to
+    catch up on missed turns), which are all applied once the batch is ended
+    by entering another blank suggesting player. Entering '?' instead shows
+    why a ledger entry was marked.
+    """
     suggesting_prefix = input('Enter suggesting player: ').strip()
+    while suggesting_prefix == '?':
+        explain_entry(all_players, ledger)
+        suggesting_prefix = input('Enter suggesting player: ').strip()
+    if suggesting_prefix != '':
+        entries = [read_suggestion(suggesting_prefix, player, all_players)]
+    else:
+        entries = []
+        while True:
+            suggesting_prefix = input(
+                'Enter suggesting player (blank to finish): '
+            ).strip()
+            if suggesting_prefix == '':
+                break
+            entries.append(
+                read_suggestion(suggesting_prefix, player, all_players)
+            )
+
+    record_suggestions(
+        player,
+        all_players,
+        ledger,
+        shown_cards,
+        skipped_cards,
+        suggestions,
+        entries
+    )
+
+
+def explain_entry(all_players: List[str], ledger: Ledger) -> None:
+    """Prompts for a ledger entry and shows the deductions behind it."""
+    card = Card.parse(input('Enter card to explain: ').strip())
+    player = prefix.find_match(
+        input('Enter player to explain: ').strip(),
+        all_players
+    )
+    lines = ledger.explain(card, player)
+    print()
+    print('\n'.join(lines) if lines else 'Nothing is known about this entry.')
+    print()
+
+
+def read_suggestion(
+    suggesting_prefix: str,
+    player: str,
+    all_players: List[str]
+) -> Suggestion:
+    """Prompts the user for the remaining info about a single suggestion."""
+
+    # Prompt user to enter relevant info for the suggestion
     suggested_card_prefixes = input('Enter suggested cards: ').strip().split()
     showing_prefix = input('Enter player showing: ').strip()
     assert len(suggested_card_prefixes) == 3, 'Suggestions involve 3 cards'
@@ -107,13 +385,6 @@ def process_input(
         prefix.find_match(showing_prefix, all_players)
     )
 
-    # Get passing players based on suggesting and showing players
-    passing_players = find_passing_players(
-        all_players,
-        suggesting_player,
-        showing_player
-    )
-
     # Handle cases where user is directly involved in suggestion
     shown_card: Optional[Card] = None
     if (
@@ -121,19 +392,51 @@ def process_input(
         and player in (suggesting_player, showing_player)
     ):
         shown_card = Card.parse(input('Enter shown card: ').strip())
-        if player == showing_player:
+
+    return suggesting_player, suggested_cards, showing_player, shown_card
+
+
+def record_suggestions(
+    player: str,
+    all_players: List[str],
+    ledger: Ledger,
+    shown_cards: ShownCardTracker,
+    skipped_cards: SkippedCardTracker,
+    suggestions: SuggestionTracker,
+    entries: List[Suggestion]
+) -> None:
+    """Updates the ledger and trackers after a sequence of suggestions.
+
+    The ledger is updated for all suggestions at once, so that deductions only
+    need to be made once for the whole sequence.
+    """
+    events: List[Ledger.Event] = []
+    for suggesting_player, suggested_cards, showing_player, shown_card in (
+        entries
+    ):
+        # Get passing players based on suggesting and showing players
+        passing_players = find_passing_players(
+            all_players,
+            suggesting_player,
+            showing_player
+        )
+        events.append(
+            (suggested_cards, passing_players, showing_player, shown_card)
+        )
+
+        # Update suggestion/card trackers
+        if player == showing_player and shown_card is not None:
             shown_cards.update(suggesting_player, shown_card)
+        suggestions.update(
+            suggesting_player,
+            suggested_cards,
+            passing_players,
+            showing_player
+        )
+        if player in passing_players:
+            skipped_cards.update(suggested_cards)
 
-    # Update ledger and suggestion/card trackers
-    ledger.update(suggested_cards, passing_players, showing_player, shown_card)
-    suggestions.update(
-        suggesting_player,
-        suggested_cards,
-        passing_players,
-        showing_player
-    )
-    if player in passing_players:
-        skipped_cards.update(suggested_cards)
+    ledger.update_many(events)
 
 
 def find_passing_players(
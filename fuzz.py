@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+
+"""fuzz.py
+
+Differential fuzzing harness for ledger engines. Plays random legal games and
+checks that a candidate engine always agrees with the reference Ledger, then
+shrinks any game where they disagree down to a minimal sequence of events.
+
+A candidate engine is created with the same arguments as Ledger, and must
+provide the same update, update_many, get_row, and solve methods and an
+equivalent repr. Games are split into steps of one or more suggestions, which
+are passed to the reference one at a time through update. Two instances of the
+candidate are played alongside it, one given the same events through update and
+the other given each step all at once through update_many, and both are
+compared to a snapshot of the reference after each step. The default factory
+candidate checks ledgers created by LedgerFactory, while the ledger candidate
+only checks update_many, since Ledger.update is the reference itself.
+"""
+
+__author__ = 'Curtis Belmonte'
+
+import argparse
+import multiprocessing
+import random
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from ledger import Ledger, LedgerFactory
+from pieces import Card, ROOMS, SUSPECTS, WEAPONS
+
+# Type alias for a function that creates a new engine, like Ledger
+EngineFactory = Callable[
+    [List[str], List[Optional[int]], str, List[Card]],
+    Any
+]
+
+
+class Game(NamedTuple):
+    """Random legal game, as seen by a single player."""
+    all_players: List[str]
+    hand_sizes: List[Optional[int]]
+    player: str
+    own_cards: List[Card]
+    steps: List[List[Ledger.Event]]
+
+
+class Snapshot(NamedTuple):
+    """State of an engine that is compared after each step."""
+    rows: List[Tuple[FrozenSet[int], ...]]
+    solution: Optional[Tuple[Card, Card, Card]]
+    representation: str
+
+
+# Type alias for snapshots of the reference, keyed by the steps played so far
+SnapshotCache = Dict[Tuple[Tuple[Any, ...], ...], Snapshot]
+
+
+# Candidate engines that can be fuzzed by name
+CANDIDATES: Dict[str, EngineFactory] = {
+    'factory': LedgerFactory().create,
+    'ledger': Ledger,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Fuzz a ledger engine')
+    parser.add_argument(
+        '--candidate',
+        choices=sorted(CANDIDATES),
+        default='factory',
+        help='name of the candidate engine to compare against Ledger'
+    )
+    parser.add_argument(
+        '--games',
+        type=int,
+        default=1000,
+        help='number of random games to play'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='seed for the first game; each game uses the next seed'
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='number of worker processes'
+    )
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    failures = run_parallel(args.candidate, args.seed, args.games, args.jobs)
+    elapsed_time = time.perf_counter() - start_time
+    print('Played {} games in {:.2f}s ({:.0f} games/s)'.format(
+        args.games,
+        elapsed_time,
+        args.games / elapsed_time
+    ))
+
+    for seed, game, message in failures:
+        print()
+        print('Seed {}: {}'.format(seed, message))
+        print(format_game(game))
+
+
+def run_parallel(
+    candidate_name: str,
+    first_seed: int,
+    game_count: int,
+    job_count: int
+) -> List[Tuple[int, Game, str]]:
+    """Fuzzes a named candidate engine using multiple worker processes.
+
+    Returns (seed, shrunk game, mismatch message) for each failing game.
+    """
+    chunk_count = max(1, min(game_count, 4 * job_count))
+    chunks = [
+        (
+            candidate_name,
+            first_seed + game_count * i // chunk_count,
+            first_seed + game_count * (i + 1) // chunk_count,
+        )
+        for i in range(chunk_count)
+    ]
+    with multiprocessing.Pool(job_count) as pool:
+        results = pool.starmap(run_seeds, chunks)
+    return [failure for result in results for failure in result]
+
+
+def run_seeds(
+    candidate_name: str,
+    start_seed: int,
+    stop_seed: int
+) -> List[Tuple[int, Game, str]]:
+    """Fuzzes a named candidate engine with games for a range of seeds.
+
+    Returns (seed, shrunk game, mismatch message) for each failing game.
+    """
+    candidate = CANDIDATES[candidate_name]
+    failures: List[Tuple[int, Game, str]] = []
+    for seed in range(start_seed, stop_seed):
+        game = generate_game(random.Random(seed))
+        if compare_engines(game, candidate) is not None:
+            # Reference snapshots are shared by every attempt to shrink a game
+            reference_cache: SnapshotCache = {}
+            game = shrink_game(game, candidate, reference_cache)
+            message = compare_engines(game, candidate, reference_cache)
+            assert message is not None
+            failures.append((seed, game, message))
+    return failures
+
+
+def generate_game(rng: random.Random) -> Game:
+    """Generates a random legal game using the given random number generator.
+
+    Cards are dealt evenly, and each opponent's hand size is hidden with some
+    probability. Players make random suggestions in turn, which are disproved
+    by the first player after them holding one of the cards.
+    """
+    player_count = rng.randint(3, 6)
+    all_players = ['P{}'.format(i + 1) for i in range(player_count)]
+    player_index = rng.randrange(player_count)
+
+    # Choose the solution and deal the remaining cards
+    solution = [rng.choice(SUSPECTS), rng.choice(WEAPONS), rng.choice(ROOMS)]
+    deck = [card for card in Card.__members__.values() if card not in solution]
+    rng.shuffle(deck)
+    dealer_index = rng.randrange(player_count)
+    hands: List[List[Card]] = [[] for _ in all_players]
+    for i, card in enumerate(deck):
+        hands[(dealer_index + i + 1) % player_count].append(card)
+    hide_probability = rng.choice((0.0, 0.5, 1.0))
+    hand_sizes: List[Optional[int]] = [
+        None
+        if i != player_index and rng.random() < hide_probability
+        else len(hand)
+        for i, hand in enumerate(hands)
+    ]
+
+    # Play a random number of turns
+    events: List[Ledger.Event] = []
+    for turn in range(rng.randint(1, 60)):
+        suggesting_index = turn % player_count
+        cards = [
+            rng.choice(SUSPECTS),
+            rng.choice(WEAPONS),
+            rng.choice(ROOMS),
+        ]
+        passing_players: List[str] = []
+        showing_player: Optional[str] = None
+        shown_card: Optional[Card] = None
+        for i in range(1, player_count):
+            other_index = (suggesting_index + i) % player_count
+            held_cards = [card for card in cards if card in hands[other_index]]
+            if held_cards:
+                showing_player = all_players[other_index]
+                if player_index in (suggesting_index, other_index):
+                    shown_card = rng.choice(held_cards)
+                break
+            passing_players.append(all_players[other_index])
+        events.append((cards, passing_players, showing_player, shown_card))
+
+    # Group the suggestions into steps of random length
+    steps: List[List[Ledger.Event]] = []
+    while events:
+        step_size = rng.randint(1, 4)
+        steps.append(events[:step_size])
+        events = events[step_size:]
+
+    return Game(
+        all_players,
+        hand_sizes,
+        all_players[player_index],
+        hands[player_index],
+        steps
+    )
+
+
+def compare_engines(
+    game: Game,
+    candidate: EngineFactory,
+    reference_cache: Optional[SnapshotCache] = None
+) -> Optional[str]:
+    """Plays a game with the reference Ledger and a candidate engine.
+
+    The candidate is played both through update and through update_many.
+    Returns a message describing the first difference from the reference, or
+    None if both agree with it after every step. Snapshots of the reference
+    are looked up in and added to reference_cache, if given.
+    """
+    single_engine, batch_engine = (
+        candidate(
+            game.all_players,
+            game.hand_sizes,
+            game.player,
+            game.own_cards
+        )
+        for _ in range(2)
+    )
+    snapshots = generate_snapshots(game, reference_cache)
+    message = find_engine_difference(
+        next(snapshots),
+        single_engine,
+        batch_engine
+    )
+    for i, (step, snapshot) in enumerate(zip(game.steps, snapshots)):
+        if message is not None:
+            break
+        for event in step:
+            single_engine.update(*event)
+        batch_engine.update_many(step)
+        message = find_engine_difference(snapshot, single_engine, batch_engine)
+        if message is not None:
+            message = 'After step {}: {}'.format(i + 1, message)
+    return message
+
+
+def generate_snapshots(
+    game: Game,
+    reference_cache: Optional[SnapshotCache] = None
+) -> Iterator[Snapshot]:
+    """Yields snapshots of the reference Ledger before and after each step.
+
+    If reference_cache is given, snapshots are looked up by the steps played
+    so far, and the reference is only played through the steps needed for
+    snapshots that aren't cached yet.
+    """
+    reference: Optional[Ledger] = None
+    played_count = 0
+    played_steps: Tuple[Tuple[Any, ...], ...] = ()
+    for i in range(len(game.steps) + 1):
+        if i > 0 and reference_cache is not None:
+            played_steps += (tuple(
+                (tuple(cards), tuple(passing), showing_player, shown_card)
+                for cards, passing, showing_player, shown_card
+                in game.steps[i - 1]
+            ),)
+
+        snapshot = None
+        if reference_cache is not None:
+            snapshot = reference_cache.get(played_steps)
+        if snapshot is None:
+            if reference is None:
+                reference = Ledger(
+                    game.all_players,
+                    game.hand_sizes,
+                    game.player,
+                    game.own_cards
+                )
+            for step in game.steps[played_count:i]:
+                for event in step:
+                    reference.update(*event)
+            played_count = i
+            snapshot = take_snapshot(reference)
+            if reference_cache is not None:
+                reference_cache[played_steps] = snapshot
+
+        yield snapshot
+
+
+def take_snapshot(engine: Any) -> Snapshot:
+    """Returns the rows, solution and repr of an engine."""
+    return Snapshot(
+        [engine.get_row(card) for card in sorted(Card.__members__.values())],
+        engine.solve(),
+        repr(engine)
+    )
+
+
+def find_engine_difference(
+    reference: Snapshot,
+    single_engine: Any,
+    batch_engine: Any
+) -> Optional[str]:
+    """Returns a message describing how either candidate engine differs.
+
+    Each message names the method that the differing engine was updated
+    through, either update or update_many.
+    """
+    for method, engine in (
+        ('update', single_engine),
+        ('update_many', batch_engine),
+    ):
+        message = find_difference(reference, engine)
+        if message is not None:
+            return 'Through {}: {}'.format(method, message)
+    return None
+
+
+def find_difference(reference: Snapshot, engine: Any) -> Optional[str]:
+    """Returns a message describing how an engine differs from a snapshot."""
+    for card, reference_row in zip(
+        sorted(Card.__members__.values()),
+        reference.rows
+    ):
+        engine_row = engine.get_row(card)
+        if reference_row != engine_row:
+            return 'Rows for {} differ: {} != {}'.format(
+                card.name,
+                reference_row,
+                engine_row
+            )
+
+    engine_solution = engine.solve()
+    if reference.solution != engine_solution:
+        return 'Solutions differ: {} != {}'.format(
+            reference.solution,
+            engine_solution
+        )
+
+    engine_representation = repr(engine)
+    if reference.representation != engine_representation:
+        return 'Representations differ:\n{}\n{}'.format(
+            reference.representation,
+            engine_representation
+        )
+
+    return None
+
+
+def shrink_game(
+    game: Game,
+    candidate: EngineFactory,
+    reference_cache: Optional[SnapshotCache] = None
+) -> Game:
+    """Shrinks a failing game to a minimal sequence of steps and events.
+
+    Repeatedly removes chunks of steps, and then single events from each step,
+    as long as the engines still disagree. Removing suggestions keeps the game
+    legal, since every remaining suggestion is still true of the same deal.
+    Snapshots of the reference are shared through reference_cache, so that
+    attempts only replay the reference after the steps they change.
+    """
+    if reference_cache is None:
+        reference_cache = {}
+
+    def fails(steps: List[List[Ledger.Event]]) -> bool:
+        shrunk_game = game._replace(steps=steps)
+        return compare_engines(
+            shrunk_game,
+            candidate,
+            reference_cache
+        ) is not None
+
+    # Remove chunks of steps, halving the chunk size when none can be removed
+    steps = game.steps
+    chunk_size = max(1, len(steps) // 2)
+    while True:
+        i = 0
+        did_remove = False
+        while i < len(steps):
+            shrunk_steps = steps[:i] + steps[i + chunk_size:]
+            if fails(shrunk_steps):
+                steps = shrunk_steps
+                did_remove = True
+            else:
+                i += chunk_size
+        if chunk_size == 1 and not did_remove:
+            break
+        chunk_size = max(1, chunk_size // 2)
+
+    # Remove single events from each remaining step
+    for i in range(len(steps)):
+        j = 0
+        while j < len(steps[i]) and len(steps[i]) > 1:
+            step = steps[i][:j] + steps[i][j + 1:]
+            shrunk_steps = steps[:i] + [step] + steps[i + 1:]
+            if fails(shrunk_steps):
+                steps = shrunk_steps
+            else:
+                j += 1
+
+    return game._replace(steps=steps)
+
+
+def format_game(game: Game) -> str:
+    """Converts a game into a human-readable list of steps and events."""
+    lines = [
+        'Players: {}'.format(' '.join(game.all_players)),
+        'Hand sizes: {}'.format(' '.join(
+            '?' if size is None else str(size) for size in game.hand_sizes
+        )),
+        '{} holds: {}'.format(
+            game.player,
+            ' '.join(card.name for card in game.own_cards)
+        ),
+    ]
+    for i, step in enumerate(game.steps):
+        lines.append('Step {}:'.format(i + 1))
+        for cards, passing_players, showing_player, shown_card in step:
+            lines.append('  {} -> [{}] -> {}{}'.format(
+                ', '.join(card.name for card in cards),
+                ', '.join(passing_players),
+                showing_player,
+                '' if shown_card is None else ' ({})'.format(shown_card.name)
+            ))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    main()
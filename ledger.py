@@ -8,11 +8,34 @@ that players hold and, by extension, the cards that make up the solution.
 
 __author__ = 'Curtis Belmonte'
 
+import copy
 import itertools
+import time
+import tracemalloc
 from collections import defaultdict
-from typing import DefaultDict, Iterable, List, Optional, Set, Tuple
+from typing import (
+    DefaultDict,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from pieces import Card, ROOMS, SUSPECTS, WEAPONS
+from provenance import Deduction, ProvenanceLog
+from scheduler import (
+    DISPROOF_IDS,
+    HAND_SIZES,
+    NO_ENTRIES,
+    RULES,
+    RuleScheduler,
+    YES_ENTRIES,
+    deduction_rule,
+)
 
 
 class Ledger(object):
@@ -22,35 +45,27 @@ class Ledger(object):
     YES = {-1}  # player has card
     NO = {-2}   # player doesn't have card
 
+    # Type alias for the arguments to a single ledger update
+    Event = Tuple[List[Card], List[str], Optional[str], Optional[Card]]
+
     def __init__(
         self,
         all_players: List[str],
-        hand_sizes: List[int],
+        hand_sizes: List[Optional[int]],
         player: str,
-        own_cards: List[Card]
+        own_cards: List[Card],
+        record_provenance: bool = False
     ) -> None:
         # Ensure user-supplied params are logically consistent
         assert len(all_players) == len(hand_sizes)
         assert player in all_players
-        assert hand_sizes[all_players.index(player)] == len(own_cards)
-
-        self._all_players = all_players
-        self._player = player
-        self._hand_sizes = hand_sizes
-        self._sheet: List[List[Set[int]]] = [
-            [set() for _ in all_players] for _ in Card.__members__
-        ]
-
-        # Update ledger based on player's held cards
         player_index = all_players.index(player)
-        for card in sorted(Card.__members__.values()):
-            if card in own_cards:
-                self._sheet[card] = [
-                    self.YES if i == player_index else self.NO
-                    for i in range(len(all_players))
-                ]
-            else:
-                self._sheet[card][player_index] = self.NO
+        assert hand_sizes[player_index] in (None, len(own_cards))
+
+        hand_sizes = list(hand_sizes)
+        hand_sizes[player_index] = len(own_cards)
+        self._set_up(all_players, hand_sizes, player, record_provenance)
+        self._mark_own_cards(own_cards)
 
         # Check if any deductions can already be made
         self._simplify()
@@ -74,6 +89,72 @@ class Ledger(object):
 
         return '\n'.join(lines)
 
+    def explain(self, card: Card, player: str) -> List[str]:
+        """Returns lines explaining why an entry was marked YES or NO.
+
+        Each line describes a change to an entry, followed by indented lines
+        for its premises, starting with the given entry and then each earlier
+        change that it depends on. Raises ValueError if the ledger was created
+        without recording provenance.
+        """
+        if self._provenance is None:
+            raise ValueError('Ledger is not recording provenance')
+
+        lines: List[str] = []
+        player_index = self._get_player_index(player)
+        for deduction in self._provenance.explain(card, player_index):
+            lines.append('{} by {}'.format(
+                self._format_change(
+                    deduction.card,
+                    deduction.player_index,
+                    deduction.is_yes
+                ),
+                self._format_rule(deduction.rule)
+            ))
+            lines += ['    ' + line for line in self._format_premises(
+                deduction
+            )]
+        return lines
+
+    def get_deduction_counts(self) -> Dict[str, int]:
+        """Returns the number of entries marked YES or NO by each rule.
+
+        Rules are identified by the names of their functions, such as the
+        _simplify_* methods, and entries marked directly based on suggestions
+        are not included. When more than one rule could deduce an entry, the
+        one that gets credit depends on the order chosen by the scheduler.
+        """
+        return dict(self._deduction_counts)
+
+    def get_hand_size_hypotheses(self) -> List[Tuple[int, ...]]:
+        """Returns all combinations of hand sizes that are still possible.
+
+        Each combination gives the number of cards held by each player, in turn
+        order.
+        """
+        return list(self._hand_size_hypotheses)
+
+    def get_hand_sizes(self) -> List[Optional[int]]:
+        """Returns the number of cards held by each player, in turn order.
+
+        The hand size for a player is None if it is not yet known.
+        """
+        return [
+            min_size if min_size == max_size else None
+            for min_size, max_size in zip(
+                self._min_hand_sizes,
+                self._max_hand_sizes
+            )
+        ]
+
+    def get_players(self) -> List[str]:
+        """Returns the names of all players in the game, in turn order."""
+        return list(self._all_players)
+
+    def get_row(self, card: Card) -> Tuple[FrozenSet[int], ...]:
+        """Returns a read-only copy of the ledger entries for the given card."""
+        return tuple(frozenset(entry) for entry in self._sheet[card])
+
     def solve(self) -> Optional[Tuple[Card, Card, Card]]:
         """Returns the cards that make up the solution, or None if ambiguous."""
         suspects = self._find_possible_cards(SUSPECTS)
@@ -97,23 +178,211 @@ class Ledger(object):
         shown_card: Optional[Card]
     ) -> None:
         """Updates the ledger after a suggestion has been made and disproved."""
-
-        # Passing players can't have any of the given cards
-        for player in passing_players:
-            for card in cards:
-                player_index = self._get_player_index(player)
-                self._mark_no(card, player_index)
-
-        # Update ledger based on showing player and/or shown card
-        if showing_player is not None:
-            if shown_card is None:
-                self._mark_other_shown(cards, showing_player)
-            elif not showing_player == self._player:
-                self._mark_player_shown(shown_card, showing_player)
+        self._mark_suggestion(
+            cards,
+            passing_players,
+            showing_player,
+            shown_card
+        )
 
         # Make any deductions based on new info
         self._simplify()
 
+    def update_many(self, events: Iterable['Ledger.Event']) -> None:
+        """Updates the ledger after a sequence of suggestions.
+
+        Each event contains the arguments for a single call to update, and the
+        resulting ledger is the same as if update had been called for each event
+        in order. Deductions are only made before events that add disproof IDs,
+        since these depend on which cards are still possible, and at the end.
+        """
+        is_pending = False
+        for cards, passing_players, showing_player, shown_card in events:
+            # Disproof IDs are only added to cards that are still possible, so
+            # any pending deductions must be made before adding new ones
+            is_disproof = showing_player is not None and shown_card is None
+            if is_pending and is_disproof:
+                self._simplify()
+            self._mark_suggestion(
+                cards,
+                passing_players,
+                showing_player,
+                shown_card
+            )
+            is_pending = True
+
+        # Make any remaining deductions based on new info
+        if is_pending:
+            self._simplify()
+
+    def _set_up(
+        self,
+        all_players: List[str],
+        hand_sizes: List[Optional[int]],
+        player: str,
+        record_provenance: bool
+    ) -> None:
+        """Initializes a blank ledger, with no entries known for any player.
+
+        The player's own hand size must be given in hand_sizes.
+        """
+        self._all_players = all_players
+        self._player = player
+
+        # Apply registered rules, counting the entries deduced by each one
+        self._scheduler = RuleScheduler(RULES)
+        self._deduction_counts: DefaultDict[str, int] = defaultdict(int)
+
+        # Optionally record why each entry was marked, so it can be explained
+        self._provenance: Optional[ProvenanceLog] = None
+        if record_provenance:
+            self._provenance = ProvenanceLog(len(all_players))
+
+        # Keep track of all combinations of hand sizes that are still possible
+        self._hand_size_hypotheses = self._find_hand_size_hypotheses(hand_sizes)
+        assert self._hand_size_hypotheses, 'No possible hand sizes for players'
+        self._min_hand_sizes: List[int] = []
+        self._max_hand_sizes: List[int] = []
+        self._update_hand_size_bounds()
+
+        self._sheet: List[List[Set[int]]] = [
+            [set() for _ in all_players] for _ in Card.__members__
+        ]
+
+    @classmethod
+    def _create_template(
+        cls,
+        all_players: List[str],
+        hand_sizes: List[Optional[int]],
+        player: str
+    ) -> 'Ledger':
+        """Creates a ledger with the deductions that don't need own cards.
+
+        The player's own hand size must be given in hand_sizes, but none of
+        their entries are marked.
+        """
+        template = cls.__new__(cls)
+        template._set_up(all_players, hand_sizes, player, False)
+        template._simplify()
+        return template
+
+    def _is_blank(self) -> bool:
+        """Checks if no entries have been deduced for the ledger."""
+        return not self._deduction_counts
+
+    def _stamp(
+        self,
+        all_players: List[str],
+        player: str,
+        own_cards: List[Card]
+    ) -> 'Ledger':
+        """Creates a new ledger from this template and the player's cards.
+
+        The template must be blank, so the new ledger starts out the same as
+        one created from scratch. Since hand sizes add up to the number of
+        cards dealt, marking the player's cards only enables deductions if it
+        leaves at most one possible card in some category. Otherwise, the rules
+        would each be applied once without making any changes, as they were
+        for the template, so the template's scheduler history is copied.
+        """
+        ledger = copy.copy(self)
+        ledger._all_players = all_players
+        ledger._player = player
+        ledger._deduction_counts = defaultdict(int)
+
+        # Unknown entries are empty, and need a new set for each ledger
+        ledger._sheet = [[set() for _ in row] for row in self._sheet]
+        ledger._mark_own_cards(own_cards)
+
+        # Check if the player's cards leave any deductions to be made
+        if any(
+            sum(1 for card in category if card not in own_cards) <= 1
+            for category in (SUSPECTS, WEAPONS, ROOMS)
+        ):
+            ledger._scheduler = RuleScheduler(RULES)
+            ledger._min_hand_sizes = []
+            ledger._max_hand_sizes = []
+            ledger._update_hand_size_bounds()
+            ledger._simplify()
+        else:
+            ledger._scheduler = self._scheduler.copy()
+
+        return ledger
+
+    def _mark_own_cards(self, own_cards: List[Card]) -> None:
+        """Updates the ledger based on the player's held cards."""
+        player_index = self._get_player_index(self._player)
+        for card in sorted(Card.__members__.values()):
+            if card in own_cards:
+                self._sheet[card] = [
+                    self.YES if i == player_index else self.NO
+                    for i in range(len(self._all_players))
+                ]
+            else:
+                self._sheet[card][player_index] = self.NO
+
+            # Record the entries known from the player's own cards
+            if self._provenance is not None:
+                for p, entry in enumerate(self._sheet[card]):
+                    if entry in (self.YES, self.NO):
+                        self._provenance.record_change(
+                            card,
+                            p,
+                            entry == self.YES,
+                            'own cards'
+                        )
+
+    def _format_change(
+        self,
+        card: Card,
+        player_index: int,
+        is_yes: bool
+    ) -> str:
+        """Converts an entry and its value into a human-readable string."""
+        return '{} for {}: {}'.format(
+            card.name,
+            self._all_players[player_index],
+            'YES' if is_yes else 'NO'
+        )
+
+    def _format_premises(self, deduction: Deduction) -> List[str]:
+        """Converts the premises of a deduction into human-readable lines."""
+        assert self._provenance is not None
+        lines = ['suggestion {} ({})'.format(
+            number,
+            ', '.join(
+                card.name
+                for card in self._provenance.get_suggestion_cards(number)
+            )
+        ) for number in deduction.suggestions]
+        lines += [
+            self._format_change(card, player_index, is_yes)
+            for card, player_index, is_yes in deduction.cells
+        ]
+        lines += ['{} disproved suggestion {} ({})'.format(
+            self._all_players[player_index],
+            number,
+            ', '.join(
+                card.name
+                for card in self._provenance.get_suggestion_cards(number)
+            )
+        ) for player_index, number in deduction.disproofs]
+        lines += ['{} holds {} card(s)'.format(
+            self._all_players[player_index],
+            min_size if min_size == max_size else '{}-{}'.format(
+                min_size,
+                max_size
+            )
+        ) for player_index, min_size, max_size in deduction.hand_sizes]
+        return lines
+
+    @staticmethod
+    def _format_rule(rule: str) -> str:
+        """Converts the name of a rule into a human-readable string."""
+        if rule.startswith('_simplify_'):
+            rule = rule[len('_simplify_'):]
+        return rule.replace('_', ' ')
+
     def _format_card(self, card: Card) -> str:
         """Converts a card into a string that can be used as a row label."""
         if self._is_solution(card):
@@ -146,13 +415,17 @@ class Ledger(object):
 
     def _mark_no(self, card: Card, player_index: int) -> None:
         """Updates the ledger entry for the given card and player to NO."""
+        self._record_change(card, player_index, self.NO)
         self._sheet[card][player_index] = self.NO
 
     def _mark_yes(self, card: Card, player_index: int) -> None:
         """Updates the ledger entry for the given card and player to YES."""
+        self._record_change(card, player_index, self.YES)
 
         # Clean up disproved suggestions now that we know player has card
         disproof_ids = self._sheet[card][player_index]
+        if disproof_ids in (self.YES, self.NO):
+            disproof_ids = set()
         for c in Card.__members__.values():
             if c != card:
                 self._sheet[c][player_index] = (
@@ -161,6 +434,41 @@ class Ledger(object):
 
         self._sheet[card][player_index] = self.YES
 
+    def _record_change(
+        self,
+        card: Card,
+        player_index: int,
+        value: Set[int]
+    ) -> None:
+        """Records that an entry is about to be marked YES or NO.
+
+        Notifies the scheduler of which parts of the ledger state will change,
+        counts the change toward the rule currently being applied, if any, and
+        records its provenance if enabled.
+        """
+        entry = self._sheet[card][player_index]
+        if entry == value:
+            return
+
+        self._scheduler.mark_changed(
+            YES_ENTRIES if value == self.YES else NO_ENTRIES
+        )
+        if entry == self.YES:
+            self._scheduler.mark_changed(YES_ENTRIES)
+        elif entry != self.NO and entry:
+            self._scheduler.mark_changed(DISPROOF_IDS)
+
+        rule = self._scheduler.get_current_rule()
+        if rule is not None:
+            self._deduction_counts[rule] += 1
+        if self._provenance is not None:
+            self._provenance.record_change(
+                card,
+                player_index,
+                value == self.YES,
+                'suggestion' if rule is None else rule
+            )
+
     def _fill_column(self, col: int, value: Set[int]) -> bool:
         """Fills all unknown entries in the given column with a given value.
 
@@ -206,6 +514,30 @@ class Ledger(object):
         """Checks if a given card is definitely part of the solution."""
         return all([entry == self.NO for entry in self._sheet[card]])
 
+    def _mark_suggestion(
+        self,
+        cards: List[Card],
+        passing_players: List[str],
+        showing_player: Optional[str],
+        shown_card: Optional[Card]
+    ) -> None:
+        """Updates ledger entries for a suggestion without making deductions."""
+        if self._provenance is not None:
+            self._provenance.record_suggestion(cards)
+
+        # Passing players can't have any of the given cards
+        for player in passing_players:
+            for card in cards:
+                player_index = self._get_player_index(player)
+                self._mark_no(card, player_index)
+
+        # Update ledger based on showing player and/or shown card
+        if showing_player is not None:
+            if shown_card is None:
+                self._mark_other_shown(cards, showing_player)
+            elif not showing_player == self._player:
+                self._mark_player_shown(shown_card, showing_player)
+
     def _mark_other_shown(self, cards: List[Card], showing_player: str) -> None:
         """Updates the ledger after another player's suggestion is disproved."""
 
@@ -223,12 +555,45 @@ class Ledger(object):
             for card in cards:
                 if self._sheet[card][player_index] != self.NO:
                     self._sheet[card][player_index].add(disproof_id)
+            self._scheduler.mark_changed(DISPROOF_IDS)
+            if self._provenance is not None:
+                self._provenance.record_disproof(player_index, disproof_id)
 
     def _mark_player_shown(self, shown_card: Card, showing_player: str) -> None:
         """Updates the ledger after the player's suggestion is disproved."""
         player_index = self._get_player_index(showing_player)
         self._mark_yes(shown_card, player_index)
 
+    @staticmethod
+    def _find_hand_size_hypotheses(
+        hand_sizes: List[Optional[int]]
+    ) -> List[Tuple[int, ...]]:
+        """Returns all possible combinations of hand sizes for players.
+
+        Unknown hand sizes (given as None) are assumed to be within one card of
+        each other, as when all cards are dealt out evenly. Every combination
+        must account for all of the cards that are dealt to players.
+        """
+        dealt_count = len(Card.__members__) - 3
+        if None not in hand_sizes:
+            sizes = tuple(size for size in hand_sizes if size is not None)
+            return [sizes] if sum(sizes) == dealt_count else []
+
+        min_size = dealt_count // len(hand_sizes)
+        possible_sizes = [
+            [min_size, min_size + 1] if size is None else [size]
+            for size in hand_sizes
+        ]
+        return [
+            sizes for sizes in itertools.product(*possible_sizes)
+            if sum(sizes) == dealt_count
+        ]
+
+    def _find_disproofs(self, player_index: int) -> Iterator[Tuple[int, int]]:
+        """Yields (player index, disproof ID) for each of a player's IDs."""
+        for disproof_id in self._get_disproof_id_map(player_index):
+            yield player_index, disproof_id
+
     def _get_player_index(self, player: str) -> int:
         """Finds the numeric index for a player with the given name."""
         for i, value in enumerate(self._all_players):
@@ -261,20 +626,108 @@ class Ledger(object):
             new_id += 1
         return new_id
 
+    def _set_premises(
+        self,
+        cells: Iterable[Tuple[int, int]] = (),
+        disproofs: Iterable[Tuple[int, int]] = (),
+        hand_size_players: Iterable[int] = ()
+    ) -> None:
+        """Sets the premises for the next entries marked, if recording them.
+
+        cells: (card, player index) for each known entry the deduction uses
+        disproofs: (player index, disproof ID) for each suggestion it uses
+        hand_size_players: Indices of players whose hand sizes it uses
+
+        Arguments may be generators, which are only consumed if provenance is
+        being recorded and an entry is marked before the premises are reset.
+        """
+        if self._provenance is not None:
+            self._provenance.set_premises(
+                cells,
+                disproofs,
+                (
+                    (p, self._min_hand_sizes[p], self._max_hand_sizes[p])
+                    for p in hand_size_players
+                ) if hand_size_players else ()
+            )
+
+    def _update_hand_size_bounds(self) -> bool:
+        """Updates the min and max possible hand size for each player.
+
+        Returns True if the bounds for any player have changed, or False if they
+        are unchanged.
+        """
+        min_hand_sizes = [min(sizes) for sizes in zip(
+            *self._hand_size_hypotheses
+        )]
+        max_hand_sizes = [max(sizes) for sizes in zip(
+            *self._hand_size_hypotheses
+        )]
+        did_change = (
+            min_hand_sizes != self._min_hand_sizes
+            or max_hand_sizes != self._max_hand_sizes
+        )
+        self._min_hand_sizes = min_hand_sizes
+        self._max_hand_sizes = max_hand_sizes
+        if did_change:
+            self._scheduler.mark_changed(HAND_SIZES)
+        return did_change
+
     def _simplify(self) -> None:
-        """Tries to simplify the ledger by making deductions about cards."""
-        did_change = True
-        while did_change:
-            did_change = any((
-                self._simplify_known_holders(),
-                self._simplify_max_no_counts(),
-                self._simplify_max_yes_counts(),
-                self._simplify_solved_categories(),
-                self._simplify_single_possibilities(),
-                self._simplify_single_shown_cards(),
-                self._simplify_sufficient_shown_cards(),
-            ))
+        """Tries to simplify the ledger by making deductions about cards.
+
+        Deduction rules are registered with the deduction_rule decorator, and
+        are applied by the scheduler until none of them change the ledger.
+        """
+        self._scheduler.run(self)
+
+    @deduction_rule(YES_ENTRIES, NO_ENTRIES)
+    def _simplify_hand_sizes(self) -> bool:
+        """Simplifies ledger by ruling out impossible hand sizes for players.
+
+        Specifically, discards each possible combination of hand sizes in which
+        a player would hold fewer cards than we have marked YES for them, or
+        more cards than we have not marked NO for them. Since deductions are
+        made using the min or max possible hand size for each player, they hold
+        for all remaining combinations.
 
+        Returns True if the range of possible hand sizes for any player changes
+        as a result of applying this rule, or False if it is unchanged.
+        """
+
+        # Hand sizes can't be narrowed down if they're already known
+        if len(self._hand_size_hypotheses) == 1:
+            return False
+
+        # Count YES and NO entries in each player's column
+        num_cards = len(self._sheet)
+        self._scheduler.add_work(
+            (num_cards + len(self._hand_size_hypotheses))
+            * len(self._all_players)
+        )
+        yes_counts = [0] * len(self._all_players)
+        no_counts = [0] * len(self._all_players)
+        for row in self._sheet:
+            for p, entry in enumerate(row):
+                if entry == self.YES:
+                    yes_counts[p] += 1
+                elif entry == self.NO:
+                    no_counts[p] += 1
+
+        # Keep hand sizes that are consistent with these counts, if any
+        hypotheses = [
+            sizes for sizes in self._hand_size_hypotheses
+            if all(
+                yes_counts[p] <= size <= num_cards - no_counts[p]
+                for p, size in enumerate(sizes)
+            )
+        ]
+        if not hypotheses or len(hypotheses) == len(self._hand_size_hypotheses):
+            return False
+        self._hand_size_hypotheses = hypotheses
+        return self._update_hand_size_bounds()
+
+    @deduction_rule(YES_ENTRIES)
     def _simplify_known_holders(self) -> bool:
         """Simplifies ledger by applying a "single holder" rule for each card.
 
@@ -284,20 +737,24 @@ class Ledger(object):
         Returns True if the ledger changes as a result of applying this rule, or
         False if the ledger is unchanged.
         """
+        self._scheduler.add_work(len(self._sheet) * len(self._all_players))
         did_change = False
         for i, row in enumerate(self._sheet):
             for j, entry in enumerate(row):
                 if entry == self.YES:
-                    # Mark NO for all other players in this row
-                    did_change = self._fill_row(i, self.NO) or did_change
+                    # Mark NO for all other players in this row, if needed
+                    if row.count(self.NO) < len(row) - 1:
+                        self._set_premises(cells=[(i, j)])
+                        did_change = self._fill_row(i, self.NO) or did_change
                     break
         return did_change
 
+    @deduction_rule(NO_ENTRIES, HAND_SIZES)
     def _simplify_max_no_counts(self) -> bool:
         """Simplifies ledger by applying a "max NO count" rule for each player.
 
         Specifically, for each player that we have marked as not having a number
-        of cards equal to total_cards - (hand_size - yes_count), marks the
+        of cards equal to total_cards - (min_hand_size - yes_count), marks the
         player as having all of the remaining cards.
 
         Returns True if the ledger changes as a result of applying this rule, or
@@ -306,6 +763,7 @@ class Ledger(object):
 
         did_change = False
         num_cards = len(self._sheet)
+        self._scheduler.add_work(num_cards * len(self._all_players))
         for p in range(len(self._all_players)):
             # Count NO entries in player's column
             no_count = 0
@@ -314,23 +772,32 @@ class Ledger(object):
                     no_count += 1
 
             # If NO count is max possible, make all other column entries YES
-            if no_count >= num_cards - self._hand_sizes[p]:
+            if no_count >= num_cards - self._min_hand_sizes[p]:
+                self._set_premises(
+                    cells=(
+                        (i, p) for i in range(num_cards)
+                        if self._sheet[i][p] == self.NO
+                    ),
+                    hand_size_players=[p]
+                )
                 did_change = self._fill_column(p, self.YES) or did_change
 
         return did_change
 
+    @deduction_rule(YES_ENTRIES, HAND_SIZES)
     def _simplify_max_yes_counts(self) -> bool:
         """Simplifies ledger by applying a "max YES count" rule for each player.
 
         Specifically, for each player that we have marked as having a number of
-        cards equal to hand_size, marks that player as not having all of the
-        remaining cards.
+        cards equal to max_hand_size, marks that player as not having all of
+        the remaining cards.
 
         Returns True if the ledger changes as a result of applying this rule, or
         False if the ledger is unchanged.
         """
 
         did_change = False
+        self._scheduler.add_work(len(self._sheet) * len(self._all_players))
         for p in range(len(self._all_players)):
             # Count YES entries in player's column
             yes_count = 0
@@ -339,11 +806,19 @@ class Ledger(object):
                     yes_count += 1
 
             # If YES count is max possible, make all other column entries NO
-            if yes_count >= self._hand_sizes[p]:
+            if yes_count >= self._max_hand_sizes[p]:
+                self._set_premises(
+                    cells=(
+                        (c, p) for c in Card.__members__.values()
+                        if self._sheet[c][p] == self.YES
+                    ),
+                    hand_size_players=[p]
+                )
                 did_change = self._fill_column(p, self.NO) or did_change
 
         return did_change
 
+    @deduction_rule(NO_ENTRIES)
     def _simplify_solved_categories(self) -> bool:
         """Simplifies ledger by applying a "solved category" rule for all cards.
 
@@ -354,6 +829,7 @@ class Ledger(object):
         Returns True if the ledger changes as a result of applying this rule, or
         False if the ledger is unchanged.
         """
+        self._scheduler.add_work(len(self._sheet) * len(self._all_players))
         did_change = False
         for category in (SUSPECTS, WEAPONS, ROOMS):
             did_change = self._simplify_solved_category(category) or did_change
@@ -380,6 +856,7 @@ class Ledger(object):
                 break
 
         if solution_card is not None:
+            num_players = len(self._all_players)
             for card in category:
                 # No need to simplify row with solution card
                 if card == solution_card:
@@ -401,11 +878,19 @@ class Ledger(object):
 
                 # Mark only possible owner as holding card
                 if owner_index is not None:
+                    self._set_premises(cells=itertools.chain(
+                        ((solution_card, p) for p in range(num_players)),
+                        (
+                            (card, p) for p in range(num_players)
+                            if p != owner_index
+                        )
+                    ))
                     self._mark_yes(card, owner_index)
                     did_change = True
 
         return did_change
 
+    @deduction_rule(YES_ENTRIES, NO_ENTRIES)
     def _simplify_single_possibilities(self) -> bool:
         """Simplifies ledger by applying a "1 possibility" rule for all cards.
 
@@ -416,6 +901,7 @@ class Ledger(object):
         Returns True if the ledger changes as a result of applying this rule, or
         False if the ledger is unchanged.
         """
+        self._scheduler.add_work(len(self._sheet) * len(self._all_players))
         did_change = False
         for category in (SUSPECTS, WEAPONS, ROOMS):
             did_change = self._simplify_single_possible(category) or did_change
@@ -433,9 +919,15 @@ class Ledger(object):
         did_change = False
         possible_cards = self._find_possible_cards(category)
         if len(possible_cards) == 1:
+            self._set_premises(cells=(
+                (card, p) for card in category
+                for p, entry in enumerate(self._sheet[card])
+                if entry == self.YES
+            ))
             did_change = self._fill_row(possible_cards[0], self.NO)
         return did_change
 
+    @deduction_rule(DISPROOF_IDS)
     def _simplify_single_shown_cards(self) -> bool:
         """Simplifies ledger by applying a "1 shown card" rule for each player.
 
@@ -445,15 +937,23 @@ class Ledger(object):
         Returns True if the ledger changes as a result of applying this rule, or
         False if the ledger is unchanged.
         """
+        self._scheduler.add_work(len(self._sheet) * len(self._all_players))
         did_change = False
         for player_index in range(len(self._all_players)):
             disproof_id_map = self._get_disproof_id_map(player_index)
-            for cards in disproof_id_map.values():
+            for disproof_id, cards in disproof_id_map.items():
                 if len(cards) == 1:
+                    self._set_premises(disproofs=[(player_index, disproof_id)])
                     self._mark_yes(list(cards)[0], player_index)
                     did_change = True
         return did_change
 
+    @deduction_rule(
+        YES_ENTRIES,
+        DISPROOF_IDS,
+        HAND_SIZES,
+        is_expensive=True
+    )
     def _simplify_sufficient_shown_cards(self) -> bool:
         """Simplifies ledger by applying a "sufficient shown cards" rule.
 
@@ -464,9 +964,18 @@ class Ledger(object):
         Returns True if the ledger changes as a result of applying this rule, or
         False if the ledger is unchanged.
         """
+        self._scheduler.add_work(len(self._sheet) * len(self._all_players))
         did_change = False
         for player_index in range(len(self._all_players)):
             if self._has_sufficient_shown_cards(player_index):
+                self._set_premises(
+                    cells=(
+                        (c, player_index) for c in Card.__members__.values()
+                        if self._sheet[c][player_index] == self.YES
+                    ),
+                    disproofs=self._find_disproofs(player_index),
+                    hand_size_players=[player_index]
+                )
                 for c in Card.__members__.values():
                     if not self._sheet[c][player_index]:
                         self._mark_no(c, player_index)
@@ -474,7 +983,11 @@ class Ledger(object):
         return did_change
 
     def _has_sufficient_shown_cards(self, player_index: int) -> bool:
-        """Checks if a player satisfies the "sufficient shown cards" rule."""
+        """Checks if a player satisfies the "sufficient shown cards" rule.
+
+        Reports the number of possible sequences of shown cards checked as
+        work to the scheduler.
+        """
 
         # Count number of cards we already know player has
         yes_count = 0
@@ -484,14 +997,141 @@ class Ledger(object):
 
         # Check if shown cards cover their remaining cards
         is_sufficient = True
-        hand_size = self._hand_sizes[player_index]
+        hand_size = self._max_hand_sizes[player_index]
         if yes_count < hand_size:
+            disproof_id_map = self._get_disproof_id_map(player_index)
+
+            # Each suggestion accounts for at most one card
+            if len(disproof_id_map) < hand_size - yes_count:
+                return False
+
             possible_seqs: Iterable[Iterable[Card]] = itertools.product(
-                *(self._get_disproof_id_map(player_index).values())
+                *disproof_id_map.values()
             )
-            for shown_seq in possible_seqs:
+            seq_count = 0
+            for seq_count, shown_seq in enumerate(possible_seqs, 1):
                 if len(set(shown_seq)) < hand_size - yes_count:
                     is_sufficient = False
                     break
+            self._scheduler.add_work(seq_count)
 
         return is_sufficient
+
+
+class LedgerFactory(object):
+    """Creates ledgers, reusing work for repeated game configurations.
+
+    For each combination of hand sizes and seat of the player, a template
+    ledger is created and simplified without the player's cards. New ledgers
+    for that configuration are copied from the template, with the player's
+    cards marked on top. Ledgers created this way are the same as ones created
+    directly, including the history that the scheduler uses to order rules, so
+    later updates make the same deductions and credit them to the same rules.
+
+    A template that makes deductions of its own, as when a player holds no
+    cards, can't be copied without changing which rules get credit for them,
+    so ledgers for that configuration are created directly instead.
+
+    The factory measures the time taken to create ledgers, including any
+    templates, and the memory allocated for each ledger while tracemalloc is
+    tracing.
+    """
+
+    def __init__(self) -> None:
+        # Template for each configuration, or None if it isn't blank
+        self._templates: Dict[
+            Tuple[Tuple[int, ...], int],
+            Optional[Ledger]
+        ] = {}
+
+        # Measurements of ledger creation
+        self._ledger_count = 0
+        self._seconds = 0.0
+        self._traced_count = 0
+        self._traced_bytes = 0
+
+    def create(
+        self,
+        all_players: List[str],
+        hand_sizes: List[Optional[int]],
+        player: str,
+        own_cards: List[Card],
+        record_provenance: bool = False
+    ) -> Ledger:
+        """Creates a ledger, taking the same arguments as Ledger.
+
+        Ledgers that record provenance are created directly, since the
+        template doesn't record why its entries were marked.
+        """
+        if record_provenance:
+            return Ledger(
+                all_players,
+                hand_sizes,
+                player,
+                own_cards,
+                record_provenance
+            )
+
+        is_tracing = tracemalloc.is_tracing()
+        if is_tracing:
+            start_bytes = tracemalloc.get_traced_memory()[0]
+        start_time = time.perf_counter()
+
+        # Ensure user-supplied params are logically consistent
+        assert len(all_players) == len(hand_sizes)
+        assert player in all_players
+        player_index = all_players.index(player)
+        assert hand_sizes[player_index] in (None, len(own_cards))
+
+        # Find or create the template for this configuration
+        full_hand_sizes = list(hand_sizes)
+        full_hand_sizes[player_index] = len(own_cards)
+        key = (
+            tuple(-1 if size is None else size for size in full_hand_sizes),
+            player_index,
+        )
+        if key not in self._templates:
+            new_template = Ledger._create_template(
+                all_players,
+                full_hand_sizes,
+                player
+            )
+            self._templates[key] = (
+                new_template if new_template._is_blank() else None
+            )
+
+        template = self._templates[key]
+        if template is None:
+            ledger = Ledger(all_players, hand_sizes, player, own_cards)
+        else:
+            ledger = template._stamp(all_players, player, own_cards)
+
+        self._seconds += time.perf_counter() - start_time
+        self._ledger_count += 1
+        if is_tracing:
+            self._traced_bytes += (
+                tracemalloc.get_traced_memory()[0] - start_bytes
+            )
+            self._traced_count += 1
+
+        return ledger
+
+    def get_stats(self) -> Dict[str, float]:
+        """Returns measurements of the ledgers created so far.
+
+        Includes the number of ledgers and templates created, the average time
+        taken to create each ledger, and the average number of bytes allocated
+        for each ledger created while tracemalloc was tracing.
+        """
+        return {
+            'ledgers': self._ledger_count,
+            'templates': len(self._templates),
+            'seconds_per_ledger': (
+                self._seconds / self._ledger_count if self._ledger_count
+                else 0.0
+            ),
+            'bytes_per_ledger': (
+                self._traced_bytes / self._traced_count if self._traced_count
+                else 0.0
+            ),
+        }
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+
+"""probability.py
+
+Provides a class for estimating the probability that each card is held by each
+player or is part of the solution, based on the current state of a ledger.
+"""
+
+__author__ = 'Curtis Belmonte'
+
+from collections import defaultdict
+from typing import DefaultDict, Dict, Iterable, List, Optional, Tuple
+
+from ledger import Ledger
+from pieces import Card, ROOMS, SUSPECTS, WEAPONS
+
+# Type aliases for the intermediate counts kept by a probability table
+Option = Tuple[int, int]               # (holder index, disproof bits)
+Signature = Tuple[Option, ...]         # possible holders for a single card
+State = Tuple[Tuple[int, ...], bool, int]  # (hand capacities, solved, bits)
+JointKey = Tuple[int, Tuple[int, ...]]  # (card, fixed solution cards so far)
+
+# Cards that complete each category, in the order that cards are counted
+_CATEGORY_ENDS = {category[-1] for category in (SUSPECTS, WEAPONS, ROOMS)}
+
+
+class ProbabilityTable(object):
+    """Probabilities of each card being held by each player or the solution.
+
+    Every deal of the cards that is consistent with the ledger is considered
+    equally likely. Deals are counted one card at a time, keeping track of how
+    many cards each player can still hold, whether the solution card for the
+    current category has been chosen, and which disproved suggestions have been
+    accounted for. Deals for every possible combination of hand sizes are
+    counted together, since the counts for the remaining cards only depend on
+    how many cards each player can still hold.
+
+    Partial deals are dropped as soon as they can't be completed, because a
+    disproved suggestion hasn't been accounted for by the time its last card
+    is dealt, so the number of partial deals to keep track of shrinks as the
+    disproved suggestions are accounted for.
+
+    In incremental mode, the forward counts for the cards up to the first
+    changed row and the backward counts for the cards after the last changed
+    row of the ledger are kept between calls to update. The remaining counts
+    are recomputed, along with the counts for every card and location, since
+    the probability of each card depends on every row through the players'
+    hand capacities. As a known limitation, the cost of an update is
+    therefore not proportional to the size of a change: a change to a single
+    row still requires the counts for every card to be recombined, and a
+    change near the first card requires nearly every forward count to be
+    rebuilt.
+    """
+
+    def __init__(self, ledger: Ledger, incremental: bool = True) -> None:
+        self._ledger = ledger
+        self._incremental = incremental
+        self._player_count = len(ledger.get_players())
+
+        # Bit assigned to each (player index, disproof ID) pair seen so far
+        self._disproof_bits: Dict[Tuple[int, int], int] = {}
+
+        # Intermediate counts, indexed by the card about to be counted
+        self._signatures: List[Signature] = []
+        self._hand_sizes: List[Tuple[int, ...]] = []
+        self._forward: List[Dict[State, int]] = []
+        self._backward: List[Dict[State, int]] = [
+            {} for _ in range(len(Card.__members__) + 1)
+        ]
+
+        # Number of consistent deals with each card in each location
+        self._counts: List[List[int]] = []
+        self._total = 0
+
+        # Disproof bits of the cards from each card on, and of only the cards
+        # before each card
+        self._future_bits: List[int] = []
+        self._past_bits: List[int] = []
+
+        # Forward counts with some cards fixed in the solution
+        self._joint_forward: Dict[JointKey, Dict[State, int]] = {}
+
+        self.update()
+
+    def __repr__(self) -> str:
+        players = self._ledger.get_players()
+        header = ' | '.join(
+            [' ' * 14] + ['{:7s}'.format(name[:7]) for name in players]
+            + ['{:7s}'.format('(soln)')]
+        )
+        lines = ['Probabilities:', header]
+
+        # Add line for each game card, with a percentage for each location
+        divider = '-' * (15 + 10 * (len(players) + 1))
+        for category in (SUSPECTS, WEAPONS, ROOMS):
+            lines.append(divider)
+            for card in category:
+                lines.append(' | '.join(
+                    ['{:14s}'.format(card.name)] + [
+                        self._format_probability(count)
+                        for count in self._counts[card]
+                    ]
+                ))
+
+        return '\n'.join(lines)
+
+    def get_holder_probability(self, card: Card, player: str) -> float:
+        """Returns the probability that the given player holds a card."""
+        player_index = self._ledger.get_players().index(player)
+        return self._counts[card][player_index] / self._total
+
+    def get_joint_solution_probability(self, cards: Iterable[Card]) -> float:
+        """Returns the probability that all given cards are in the solution.
+
+        Only the cards from the first to the last of the given cards need to be
+        recounted, since counts for the cards outside that range are kept.
+        """
+        fixed_cards = sorted(set(cards))
+        if not fixed_cards:
+            return 1.0
+
+        # Count deals up to the last given card, with given cards in solution
+        solution_option = (self._player_count, 0)
+        counts = self._forward[fixed_cards[0]]
+        for card in range(fixed_cards[0], fixed_cards[-1] + 1):
+            # Counts are shared by queries that fix the same cards so far
+            key = (card, tuple(c for c in fixed_cards if c <= card))
+            if key not in self._joint_forward:
+                signature = self._signatures[card]
+                if card in fixed_cards:
+                    signature = tuple(
+                        option for option in signature
+                        if option == solution_option
+                    )
+                self._joint_forward[key] = self._count_forward(
+                    card,
+                    counts,
+                    signature
+                )
+            counts = self._joint_forward[key]
+
+        # Combine with the kept counts for the cards after the last given card
+        total = 0
+        next_card = fixed_cards[-1] + 1
+        for (capacities, is_solved, bits), count in counts.items():
+            total += count * self._count_backward(
+                next_card,
+                (capacities, is_solved, self._future_bits[next_card] & ~bits)
+            )
+        return total / self._total
+
+    def get_state_count(self) -> int:
+        """Returns the largest number of forward states kept for any card.
+
+        The cost of a call to get_joint_solution_probability grows with this.
+        """
+        return max(len(counts) for counts in self._forward)
+
+    def get_solution_probability(self, card: Card) -> float:
+        """Returns the probability that a card is part of the solution."""
+        return self._counts[card][self._player_count] / self._total
+
+    def update(self) -> None:
+        """Recomputes all probabilities based on the current ledger state.
+
+        In incremental mode, forward counts are rebuilt from the first changed
+        row to the last card, backward counts are rebuilt for the cards up to
+        the last changed row, and the counts for every card are recombined, so
+        the cost depends on where the changed rows are rather than how many
+        there are. Raises ValueError if no deal of the cards is consistent with
+        the ledger.
+        """
+        signatures = [
+            self._get_signature(card)
+            for card in sorted(Card.__members__.values())
+        ]
+        hand_sizes = self._ledger.get_hand_size_hypotheses()
+
+        # Find the range of cards whose possible holders have changed
+        if self._incremental and self._signatures:
+            changed = [
+                i for i, signature in enumerate(signatures)
+                if signature != self._signatures[i]
+            ]
+            if not changed and hand_sizes == self._hand_sizes:
+                self._check_total()
+                return
+            first = changed[0] if changed else len(signatures)
+            last = changed[-1] if changed else -1
+        else:
+            first = 0
+            last = len(signatures) - 1
+
+        # Fall back to a full recompute if possible hand sizes have changed
+        if hand_sizes != self._hand_sizes:
+            first = 0
+        self._signatures = signatures
+        self._hand_sizes = hand_sizes
+        self._joint_forward.clear()
+        self._find_disproof_ranges()
+
+        # Forward counts for card i depend only on the cards before it
+        if first == 0:
+            self._forward = [{(sizes, False, 0): 1 for sizes in hand_sizes}]
+        else:
+            del self._forward[first + 1:]
+        for i in range(len(self._forward) - 1, len(signatures)):
+            self._forward.append(
+                self._count_forward(i, self._forward[i], signatures[i])
+            )
+
+        # Backward counts for card i depend only on the card and those after it
+        for i in range(last + 1):
+            self._backward[i].clear()
+
+        # Combine forward and backward counts for each card and location
+        self._counts = [
+            self._count_locations(i) for i in range(len(signatures))
+        ]
+        self._total = sum(self._counts[0])
+        self._check_total()
+
+    def _advance(
+        self,
+        state: State,
+        card: int,
+        option: Option,
+        is_forward: bool
+    ) -> Optional[State]:
+        """Returns the state after assigning a card, or None if impossible.
+
+        Forward states record the disproof bits that have been accounted for,
+        while backward states record the disproof bits that are still missing.
+        """
+        capacities, is_solved, state_bits = state
+        holder, bits = option
+
+        # Make sure the holder has room for the card
+        if holder == self._player_count:
+            if is_solved:
+                return None
+            is_solved = True
+        elif capacities[holder] == 0:
+            return None
+        else:
+            capacities = (
+                capacities[:holder]
+                + (capacities[holder] - 1,)
+                + capacities[holder + 1:]
+            )
+
+        # Each category must have exactly one card in the solution
+        if card in _CATEGORY_ENDS:
+            if not is_solved:
+                return None
+            is_solved = False
+
+        if is_forward:
+            state_bits |= bits
+        else:
+            state_bits &= ~bits
+        return capacities, is_solved, state_bits
+
+    def _can_finish(self, card: int, state: State) -> bool:
+        """Checks if a forward state after a card can lead to a full deal.
+
+        The state can't be finished if it is missing a disproof bit that none
+        of the later cards have.
+        """
+        past_bits = self._past_bits[card + 1]
+        return state[2] & past_bits == past_bits
+
+    def _check_total(self) -> None:
+        """Raises ValueError if no deal of the cards is consistent."""
+        if self._total == 0:
+            raise ValueError('No deal of cards is consistent with the ledger')
+
+    def _count_backward(self, card: int, state: State) -> int:
+        """Returns the number of ways to deal the given card and all after it.
+
+        The given state must be a backward state, recording the disproof bits
+        that still need to be accounted for by these cards.
+        """
+        if card == len(self._signatures):
+            capacities, _, missing_bits = state
+            return int(missing_bits == 0 and not any(capacities))
+
+        # Check if the remaining cards can account for the missing bits
+        if state[2] & ~self._future_bits[card]:
+            return 0
+
+        cache = self._backward[card]
+        count = cache.get(state)
+        if count is None:
+            count = 0
+            for option in self._signatures[card]:
+                next_state = self._advance(state, card, option, False)
+                if next_state is not None:
+                    count += self._count_backward(card + 1, next_state)
+            cache[state] = count
+
+        return count
+
+    def _count_forward(
+        self,
+        card: int,
+        prev_counts: Dict[State, int],
+        signature: Signature
+    ) -> Dict[State, int]:
+        """Returns the number of ways to deal all cards up to the given card.
+
+        prev_counts: Number of ways to deal the cards before the given card,
+            indexed by forward state
+        signature: Possible holders of the given card
+
+        Counts are indexed by the forward state after dealing the given card.
+        """
+        counts: DefaultDict[State, int] = defaultdict(int)
+        for state, count in prev_counts.items():
+            for option in signature:
+                next_state = self._advance(state, card, option, True)
+                if next_state is not None and self._can_finish(
+                    card,
+                    next_state
+                ):
+                    counts[next_state] += count
+        return counts
+
+    def _count_locations(self, card: int) -> List[int]:
+        """Returns the number of consistent deals with a card in each location.
+
+        The last location in the returned list corresponds to the solution.
+        """
+        counts = [0] * (self._player_count + 1)
+        future_bits = self._future_bits[card + 1]
+        for state, count in self._forward[card].items():
+            for option in self._signatures[card]:
+                next_state = self._advance(state, card, option, True)
+                if next_state is not None and self._can_finish(
+                    card,
+                    next_state
+                ):
+                    capacities, is_solved, bits = next_state
+                    counts[option[0]] += count * self._count_backward(
+                        card + 1,
+                        (capacities, is_solved, future_bits & ~bits)
+                    )
+        return counts
+
+    def _find_disproof_ranges(self) -> None:
+        """Finds the disproof bits that each card and the cards around it have.
+
+        For each card, finds the bits of that card and all cards after it, and
+        the bits that only the cards before it have.
+        """
+        card_count = len(self._signatures)
+        self._future_bits = [0] * (card_count + 1)
+        for card in reversed(range(card_count)):
+            self._future_bits[card] = self._future_bits[card + 1]
+            for _, bits in self._signatures[card]:
+                self._future_bits[card] |= bits
+
+        self._past_bits = [0] * (card_count + 1)
+        for card in range(card_count):
+            self._past_bits[card + 1] = (
+                self._past_bits[card] | self._future_bits[card]
+            ) & ~self._future_bits[card + 1]
+
+    def _format_probability(self, count: int) -> str:
+        """Converts a count of deals into a human-readable percentage."""
+        if count == 0:
+            probability_str = '-'
+        elif count == self._total:
+            probability_str = '100%'
+        else:
+            probability_str = '{:.1f}%'.format(100 * count / self._total)
+        return '{:7s}'.format(probability_str)
+
+    def _get_disproof_bit(self, player_index: int, disproof_id: int) -> int:
+        """Returns a unique bit for an unresolved suggestion and player."""
+        key = (player_index, disproof_id)
+        if key not in self._disproof_bits:
+            self._disproof_bits[key] = 1 << len(self._disproof_bits)
+        return self._disproof_bits[key]
+
+    def _get_signature(self, card: Card) -> Signature:
+        """Returns the possible holders of a card, based on the ledger.
+
+        Each holder is paired with the bits for the disproved suggestions that
+        would be accounted for by that holder having the card.
+        """
+        row = self._ledger.get_row(card)
+        for i, entry in enumerate(row):
+            if entry == Ledger.YES:
+                return (i, 0),
+
+        options: List[Option] = []
+        for i, entry in enumerate(row):
+            if entry != Ledger.NO:
+                bits = 0
+                for disproof_id in entry:
+                    bits |= self._get_disproof_bit(i, disproof_id)
+                options.append((i, bits))
+        options.append((self._player_count, 0))
+        return tuple(options)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+"""provenance.py
+
+Provides a compact log of why each ledger entry was marked YES or NO, which can
+be used to explain any deduction as a chain of the deductions it depends on.
+"""
+
+__author__ = 'Curtis Belmonte'
+
+from array import array
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from pieces import Card
+
+# Kinds of premises, stored in the low bits of each encoded premise
+_CELL = 0        # earlier change to a ledger entry
+_DISPROOF = 1    # suggestion disproved by a player with an unknown card
+_HAND_SIZE = 2   # possible hand sizes for a player
+_SUGGESTION = 3  # suggestion made during the game
+_KIND_BITS = 2
+
+# Encoded hand size bounds are given in base _SIZE_BASE
+_SIZE_BASE = 32
+
+
+class Deduction(NamedTuple):
+    """Single change to a ledger entry, along with the premises behind it.
+
+    cells: (card, player index, is YES) for each entry this depends on
+    disproofs: (player index, suggestion number) for each suggestion that a
+        player disproved without the user seeing the card
+    hand_sizes: (player index, min size, max size) for each hand size used
+    suggestions: Numbers of the suggestions that directly caused the change
+    """
+    card: Card
+    player_index: int
+    is_yes: bool
+    rule: str
+    cells: List[Tuple[Card, int, bool]]
+    disproofs: List[Tuple[int, int]]
+    hand_sizes: List[Tuple[int, int, int]]
+    suggestions: List[int]
+
+
+class ProvenanceLog(object):
+    """Record of the rule and premises behind each change to a ledger.
+
+    Each change is stored as integers in preallocated arrays: the changed
+    entry, the ID of the rule that made it, and the range of its premises in a
+    shared premise array. Changes made from the same premises share a single
+    range. Premises refer to earlier changes by index, so the full chain of
+    deductions behind an entry can be followed back to the suggestions and
+    cards that started it.
+
+    Recording is not free: on fuzzed games it adds roughly 5-8% to the time
+    spent in Ledger.update, mostly from the bookkeeping for each change.
+    """
+
+    def __init__(self, player_count: int) -> None:
+        self._player_count = player_count
+        cell_count = len(Card.__members__) * player_count
+
+        # Most entries change at most once, so preallocate room for them all
+        self._change_count = 0
+        self._change_cells = array('i', [0]) * (2 * cell_count)
+        self._change_rules = array('i', [0]) * (2 * cell_count)
+        self._premise_starts = array('i', [0]) * (2 * cell_count)
+        self._premise_stops = array('i', [0]) * (2 * cell_count)
+        self._premise_count = 0
+        self._premises = array('i', [0]) * (8 * cell_count)
+
+        # Latest change to each entry, or -1 if it hasn't changed
+        self._cell_changes = array('i', [-1]) * cell_count
+
+        # Names of rules, indexed by ID, and the latest rule recorded
+        self._rule_ids: Dict[str, int] = {}
+        self._rule_names: List[str] = []
+        self._last_rule = ''
+        self._last_rule_id = -1
+
+        # Cards in each suggestion, and the suggestion behind each disproof ID
+        self._suggestion_cards: List[Tuple[Card, ...]] = []
+        self._disproof_suggestions: Dict[Tuple[int, int], int] = {}
+
+        # Premises for the changes that are about to be recorded, which are
+        # only encoded from their sources once a change is actually recorded,
+        # and their range in the premise array once stored, if they have been
+        self._current_premises: Optional[List[int]] = []
+        self._current_start = -1
+        self._premise_sources: Tuple[
+            Iterable[Tuple[int, int]],
+            Iterable[Tuple[int, int]],
+            Iterable[Tuple[int, int, int]],
+        ] = ((), (), ())
+
+    def explain(self, card: Card, player_index: int) -> List[Deduction]:
+        """Returns the chain of deductions behind the given ledger entry.
+
+        The first deduction is the latest change to the entry, followed by
+        each earlier change that it depends on, directly or indirectly. The
+        list is empty if the entry hasn't changed.
+        """
+        first_change = self._cell_changes[self._get_cell(card, player_index)]
+        if first_change == -1:
+            return []
+
+        deductions: List[Deduction] = []
+        pending = [first_change]
+        seen = {first_change}
+        while pending:
+            change = pending.pop(0)
+            deduction = self._get_deduction(change)
+            deductions.append(deduction)
+            start = self._premise_starts[change]
+            stop = self._premise_stops[change]
+            for premise in self._premises[start:stop]:
+                kind = premise & ((1 << _KIND_BITS) - 1)
+                value = premise >> _KIND_BITS
+                if kind == _CELL and value not in seen:
+                    pending.append(value)
+                    seen.add(value)
+        return deductions
+
+    def get_suggestion_cards(self, number: int) -> Tuple[Card, ...]:
+        """Returns the cards in the suggestion with the given number."""
+        return self._suggestion_cards[number - 1]
+
+    def record_change(
+        self,
+        card: Card,
+        player_index: int,
+        is_yes: bool,
+        rule: str
+    ) -> None:
+        """Records a change to an entry, based on the current premises.
+
+        Changes must be recorded before the entry is updated in the ledger, so
+        that the premises are encoded from the state they were based on.
+        """
+        # Store the current premises, unless an earlier change already has
+        if self._current_start == -1:
+            if self._current_premises is None:
+                self._current_premises = self._encode_premises(
+                    *self._premise_sources
+                )
+            start = self._premise_count
+            stop = start + len(self._current_premises)
+            while stop > len(self._premises):
+                self._premises.extend(self._premises)
+            self._premises[start:stop] = array('i', self._current_premises)
+            self._premise_count = stop
+            self._current_start = start
+
+        if rule != self._last_rule:
+            rule_id = self._rule_ids.get(rule)
+            if rule_id is None:
+                rule_id = len(self._rule_names)
+                self._rule_ids[rule] = rule_id
+                self._rule_names.append(rule)
+            self._last_rule = rule
+            self._last_rule_id = rule_id
+
+        # Make room for the change, if necessary
+        change = self._change_count
+        if change == len(self._change_cells):
+            self._change_cells.extend(self._change_cells)
+            self._change_rules.extend(self._change_rules)
+            self._premise_starts.extend(self._premise_starts)
+            self._premise_stops.extend(self._premise_stops)
+
+        cell = card * self._player_count + player_index
+        self._change_cells[change] = 2 * cell + int(is_yes)
+        self._change_rules[change] = self._last_rule_id
+        self._premise_starts[change] = self._current_start
+        self._premise_stops[change] = self._premise_count
+        self._cell_changes[cell] = change
+        self._change_count += 1
+
+    def record_disproof(self, player_index: int, disproof_id: int) -> None:
+        """Records that the latest suggestion was given a disproof ID."""
+        key = (player_index, disproof_id)
+        self._disproof_suggestions[key] = len(self._suggestion_cards)
+
+    def record_suggestion(self, cards: Iterable[Card]) -> None:
+        """Records a new suggestion, and makes it the current premise."""
+        self._suggestion_cards.append(tuple(cards))
+        self._current_premises = [
+            len(self._suggestion_cards) << _KIND_BITS | _SUGGESTION
+        ]
+        self._current_start = -1
+
+    def set_premises(
+        self,
+        cells: Iterable[Tuple[int, int]] = (),
+        disproofs: Iterable[Tuple[int, int]] = (),
+        hand_sizes: Iterable[Tuple[int, int, int]] = ()
+    ) -> None:
+        """Sets the premises for the changes that are about to be recorded.
+
+        cells: (card, player index) for each known entry
+        disproofs: (player index, disproof ID) for each unresolved suggestion
+        hand_sizes: (player index, min size, max size) for each player
+
+        Arguments may be generators, which are only consumed if a change is
+        recorded before the premises are set again.
+        """
+        self._current_premises = None
+        self._current_start = -1
+        self._premise_sources = (cells, disproofs, hand_sizes)
+
+    def _encode_premises(
+        self,
+        cells: Iterable[Tuple[int, int]],
+        disproofs: Iterable[Tuple[int, int]],
+        hand_sizes: Iterable[Tuple[int, int, int]]
+    ) -> List[int]:
+        """Encodes premises as integers for the premise array.
+
+        Each unresolved suggestion also brings in the entries for its cards
+        that the disproving player is known not to hold.
+        """
+        premises: List[int] = []
+        for card, player_index in cells:
+            change = self._cell_changes[self._get_cell(card, player_index)]
+            premises.append(change << _KIND_BITS | _CELL)
+        for player_index, disproof_id in disproofs:
+            number = self._disproof_suggestions[(player_index, disproof_id)]
+            value = number * self._player_count + player_index
+            premises.append(value << _KIND_BITS | _DISPROOF)
+
+            # Cards in the suggestion that the player is known not to hold
+            for card in self._suggestion_cards[number - 1]:
+                change = self._cell_changes[self._get_cell(card, player_index)]
+                if change != -1 and self._change_cells[change] % 2 == 0:
+                    premises.append(change << _KIND_BITS | _CELL)
+        for player_index, min_size, max_size in hand_sizes:
+            value = (
+                (player_index * _SIZE_BASE + min_size) * _SIZE_BASE
+                + max_size
+            )
+            premises.append(value << _KIND_BITS | _HAND_SIZE)
+        return premises
+
+    def _get_cell(self, card: int, player_index: int) -> int:
+        """Returns the index of a ledger entry in the per-entry arrays."""
+        return card * self._player_count + player_index
+
+    def _get_deduction(self, change: int) -> Deduction:
+        """Decodes the change with the given index and its premises."""
+        cell, is_yes = divmod(self._change_cells[change], 2)
+        card, player_index = divmod(cell, self._player_count)
+        deduction = Deduction(
+            Card(card),
+            player_index,
+            bool(is_yes),
+            self._rule_names[self._change_rules[change]],
+            [],
+            [],
+            [],
+            []
+        )
+
+        start = self._premise_starts[change]
+        stop = self._premise_stops[change]
+        for premise in self._premises[start:stop]:
+            kind = premise & ((1 << _KIND_BITS) - 1)
+            value = premise >> _KIND_BITS
+            if kind == _CELL:
+                premise_cell, premise_is_yes = divmod(
+                    self._change_cells[value],
+                    2
+                )
+                premise_card, premise_player = divmod(
+                    premise_cell,
+                    self._player_count
+                )
+                deduction.cells.append(
+                    (Card(premise_card), premise_player, bool(premise_is_yes))
+                )
+            elif kind == _DISPROOF:
+                number, premise_player = divmod(value, self._player_count)
+                deduction.disproofs.append((premise_player, number))
+            elif kind == _HAND_SIZE:
+                value, max_size = divmod(value, _SIZE_BASE)
+                premise_player, min_size = divmod(value, _SIZE_BASE)
+                deduction.hand_sizes.append(
+                    (premise_player, min_size, max_size)
+                )
+            else:
+                deduction.suggestions.append(value)
+
+        return deduction
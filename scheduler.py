@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+"""scheduler.py
+
+Provides a registry of deduction rules for ledgers, and a class for deciding
+which rule to apply next. Each rule declares which parts of the ledger state it
+reads, so that it is only applied again once one of those parts has changed.
+"""
+
+__author__ = 'Curtis Belmonte'
+
+from typing import Any, Callable, FrozenSet, List, NamedTuple, Optional
+
+# Parts of the ledger state that deduction rules can read
+YES_ENTRIES = 'yes_entries'
+NO_ENTRIES = 'no_entries'
+DISPROOF_IDS = 'disproof_ids'
+HAND_SIZES = 'hand_sizes'
+
+# Type alias for a function that applies a rule, returning True on a change
+RuleFunction = Callable[[Any], bool]
+
+
+class Rule(NamedTuple):
+    """Deduction rule that can be applied to a ledger."""
+    name: str
+    apply: RuleFunction
+    reads: FrozenSet[str]
+    is_expensive: bool
+
+
+# Rules applied to every new ledger, in the order they were registered
+RULES: List[Rule] = []
+
+
+def deduction_rule(
+    *reads: str,
+    is_expensive: bool = False
+) -> Callable[[RuleFunction], RuleFunction]:
+    """Returns a decorator that registers a function as a deduction rule.
+
+    reads: Parts of the ledger state that the rule depends on
+    is_expensive: Whether the rule should be deferred until all cheap rules
+        have stopped making deductions
+
+    The decorated function takes a ledger and returns True if it changes the
+    ledger, and is left unchanged, so ledger methods can be registered too. It
+    can report the work it does through the add_work method of the ledger's
+    scheduler, so that it is ordered by cost along with the other rules.
+    """
+    def register(function: RuleFunction) -> RuleFunction:
+        RULES.append(Rule(
+            function.__name__,
+            function,
+            frozenset(reads),
+            is_expensive
+        ))
+        return function
+    return register
+
+
+class RuleScheduler(object):
+    """Applies deduction rules to a ledger until it reaches a fixed point.
+
+    Cheap rules are applied until none of them can make deductions before any
+    expensive rule is applied, and the rules in each group are tried in order
+    of their observed work per change, so rules that are cheap and often
+    useful are tried first. Work is reported by the rules themselves, such as
+    the number of entries they examine, rather than timed, and ties are broken
+    by the order in which rules were registered, so the order only depends on
+    the deductions made so far. A rule is skipped if none of the parts of the
+    ledger state that it reads have changed since it was last applied.
+    """
+
+    def __init__(self, rules: List[Rule]) -> None:
+        self._rules = list(rules)
+        self._current_rule: Optional[str] = None
+
+        # Time of the latest change to each part of the state, and the time
+        # each rule was last applied, counted in changes
+        self._clock = 0
+        self._change_times = {
+            part: 0 for rule in rules for part in rule.reads
+        }
+        self._apply_times = [-1] * len(rules)
+
+        # Observed cost and yield of each rule
+        self._apply_counts = [0] * len(rules)
+        self._change_counts = [0] * len(rules)
+        self._work_counts = [0] * len(rules)
+        self._current_work = 0
+
+    def copy(self) -> 'RuleScheduler':
+        """Returns a scheduler with the same rules and observed history."""
+        scheduler = RuleScheduler(self._rules)
+        scheduler._clock = self._clock
+        scheduler._change_times = dict(self._change_times)
+        scheduler._apply_times = list(self._apply_times)
+        scheduler._apply_counts = list(self._apply_counts)
+        scheduler._change_counts = list(self._change_counts)
+        scheduler._work_counts = list(self._work_counts)
+        return scheduler
+
+    def add_work(self, amount: int) -> None:
+        """Records work done by the rule being applied, in arbitrary units.
+
+        Every application counts as one unit of work, on top of any reported
+        by the rule. Rules should report work that grows with their running
+        time, such as the number of ledger entries they examine.
+        """
+        self._current_work += amount
+
+    def get_current_rule(self) -> Optional[str]:
+        """Returns the name of the rule being applied, if any."""
+        return self._current_rule
+
+    def mark_changed(self, part: str) -> None:
+        """Records that a part of the ledger state has changed."""
+        self._clock += 1
+        self._change_times[part] = self._clock
+
+    def run(self, ledger: Any) -> None:
+        """Applies rules to a ledger until none of them can change it."""
+        order = sorted(
+            range(len(self._rules)),
+            key=lambda i: (
+                self._rules[i].is_expensive,
+                self._get_cost(i),
+                i
+            )
+        )
+        while True:
+            for i in order:
+                if self._is_pending(i):
+                    self._apply(i, ledger)
+                    break
+            else:
+                break
+
+    def _apply(self, index: int, ledger: Any) -> None:
+        """Applies a single rule to a ledger, recording its cost and yield."""
+        rule = self._rules[index]
+        self._current_rule = rule.name
+        self._apply_times[index] = self._clock
+
+        self._current_work = 1
+        did_change = rule.apply(ledger)
+        self._work_counts[index] += self._current_work
+        self._apply_counts[index] += 1
+        if did_change:
+            self._change_counts[index] += 1
+
+        self._current_rule = None
+
+    def _get_cost(self, index: int) -> float:
+        """Estimates the work it takes for a rule to make a change.
+
+        Rules that have never been applied have no cost, so that they keep the
+        order in which they were registered until they have been observed.
+        """
+        apply_count = self._apply_counts[index]
+        if apply_count == 0:
+            return 0.0
+        change_rate = (self._change_counts[index] + 1) / (apply_count + 2)
+        return self._work_counts[index] / apply_count / change_rate
+
+    def _is_pending(self, index: int) -> bool:
+        """Checks if any state read by a rule changed since it was applied."""
+        apply_time = self._apply_times[index]
+        return any(
+            self._change_times[part] > apply_time
+            for part in self._rules[index].reads
+        )
@@ -78,6 +78,10 @@ class SuggestionTracker(object):
             lines.extend([self._format_info(info) for info in suggestions])
         return '\n'.join(lines)
 
+    def get_suggestions(self, player: str) -> List['SuggestionTracker.Info']:
+        """Returns info about all suggestions made by a player, in order."""
+        return list(self._suggestions.get(player, []))
+
     def update(
         self,
         player: str,